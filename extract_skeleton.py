@@ -4,11 +4,6 @@
 import os
 import ezdxf
 import numpy as np
-from skimage.morphology import skeletonize, medial_axis, thin
-from skimage import measure, filters, morphology
-import matplotlib.pyplot as plt
-import matplotlib.font_manager as fm
-from matplotlib import rcParams
 import cv2
 import argparse
 import subprocess
@@ -16,17 +11,68 @@ import tempfile
 import shutil
 import sys
 import gc
-import math
-import networkx as nx
+import functools
+import concurrent.futures
+import threading
 import traceback
 import logging
+import logging.handlers
 import datetime
+import json
+import re
 from pathlib import Path
+from collections import Counter, defaultdict
 import ezdxf.transform as transform
 
+# 中文字体缓存文件，避免每次启动都重新扫描系统字体
+FONT_CACHE_FILE = os.path.join(os.path.expanduser('~'), '.cache', 'room_extractor', 'font.txt')
+
+def load_cached_font():
+    """
+    读取上次运行时选定的中文字体名称
+    
+    返回:
+        字体名称；如果没有缓存或缓存的字体已不可用则返回None
+    """
+    import matplotlib.font_manager as fm
+    
+    try:
+        with open(FONT_CACHE_FILE, 'r', encoding='utf-8') as f:
+            font_name = f.read().strip()
+        if not font_name:
+            return None
+        
+        # 字体已被卸载时findfont会回退到DejaVu，此时缓存失效
+        font_path = fm.findfont(fm.FontProperties(family=font_name), fallback_to_default=False)
+        if not font_path or font_path.endswith('DejaVuSans.ttf'):
+            return None
+        return font_name
+    except Exception:
+        return None
+
+def save_cached_font(font_name):
+    """将选定的中文字体名称写入缓存文件"""
+    try:
+        os.makedirs(os.path.dirname(FONT_CACHE_FILE), exist_ok=True)
+        with open(FONT_CACHE_FILE, 'w', encoding='utf-8') as f:
+            f.write(font_name)
+    except Exception:
+        pass
+
 # 配置matplotlib支持中文显示
 def setup_matplotlib_chinese():
     """配置matplotlib支持中文显示"""
+    # matplotlib导入较慢，只在第一次绘图时才导入
+    import matplotlib.pyplot as plt
+    import matplotlib.font_manager as fm
+    
+    # 优先使用缓存的字体，跳过对系统字体的逐个查找
+    cached_font = load_cached_font()
+    if cached_font:
+        plt.rcParams['font.family'] = cached_font
+        plt.rcParams['axes.unicode_minus'] = False
+        return
+    
     # 尝试查找系统中的中文字体
     chinese_fonts = []
     # Windows 常见中文字体
@@ -51,6 +97,7 @@ def setup_matplotlib_chinese():
     # 如果找到了中文字体，设置为matplotlib默认字体
     if chinese_fonts:
         plt.rcParams['font.family'] = chinese_fonts[0]
+        save_cached_font(chinese_fonts[0])
     else:
         # 尝试使用系统默认字体
         try:
@@ -65,6 +112,7 @@ def setup_matplotlib_chinese():
                     if any(name in font_path.lower() for name in ['hei', 'yuan', 'song', 'gothic', 'ming', 'black', 'bold']):
                         plt.rcParams['font.family'] = 'sans-serif'
                         plt.rcParams['font.sans-serif'] = [font_name] + plt.rcParams['font.sans-serif']
+                        save_cached_font(font_name)
                         break
                 except:
                     continue
@@ -76,20 +124,41 @@ def setup_matplotlib_chinese():
 
 # 全局变量，用于存储ODA File Converter的路径
 ODA_PATH = r"D:\01-program\ODAFileConverter\ODAFileConverter.exe"
+# 文件内线程池 (各房间的图像和DXF输出) 的线程数，进程池工作进程中按进程数分摊CPU核心
+THREAD_WORKERS = os.cpu_count() or 1
 # 全局日志记录器
 logger = None
+# 日志系统是否包含控制台处理器，在setup_logging中设置，避免log_print每次都遍历处理器
+_HAS_CONSOLE = False
+# log_print的日志等级名称到logging等级的映射
+_LEVEL_MAP = {
+    'debug': logging.DEBUG,
+    'info': logging.INFO,
+    'warning': logging.WARNING,
+    'error': logging.ERROR,
+    'critical': logging.CRITICAL
+}
+# PNG压缩等级 (0-9)：中间结果和预览图大多是大面积纯色，低压缩等级编码快得多，文件只略大
+PNG_COMPRESSION_LEVEL = 1
+# save_image复用的画布 (Figure, Axes, AxesImage)，避免每次保存都重建Figure和坐标轴
+_save_canvas = None
+# 每个线程复用的大图像缓冲区，按 (用途, 形状, dtype) 存放，避免每次调用都重新分配整张图像
+_image_buffers = threading.local()
+# 环境变量ROOM_EXTRACTOR_DEBUG非0时，房间识别过程中把各步中间图像保存到 ./debug 目录
+_DEBUG = os.environ.get('ROOM_EXTRACTOR_DEBUG', '0').strip() not in ('', '0')
 
-def setup_logging(log_dir=None):
+def setup_logging(log_dir=None, tag=None):
     """
     设置日志记录系统
     
     参数:
         log_dir: 日志文件保存目录，如果为None则使用当前工作目录下的log文件夹
+        tag: 附加在日志文件名后的标记，多进程处理时用于区分各工作进程的日志文件
     
     返回:
         配置好的logger对象
     """
-    global logger
+    global logger, _HAS_CONSOLE
     
     # 如果已经设置过日志系统，直接返回
     if logger is not None:
@@ -104,16 +173,22 @@ def setup_logging(log_dir=None):
     
     # 创建一个新的日志文件，使用当前时间命名
     timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-    log_file = os.path.join(log_dir, f"process_{timestamp}.log")
+    log_file = os.path.join(log_dir, f"process_{timestamp}_{tag}.log" if tag else f"process_{timestamp}.log")
     
     # 配置日志记录器
     logger = logging.getLogger('extract_skeleton')
     logger.setLevel(logging.DEBUG)
     
-    # 添加文件处理器，记录到文件
-    file_handler = logging.FileHandler(log_file, encoding='utf-8')
+    # 添加文件处理器，记录到文件 (delay=True: 第一条记录写入时才创建文件)
+    file_handler = logging.FileHandler(log_file, encoding='utf-8', delay=True)
     file_handler.setLevel(logging.DEBUG)
     
+    # 用内存处理器批量写入文件，避免每条日志都触发一次write+flush
+    # 缓冲满1000条、出现ERROR及以上级别的日志或程序退出时才写入文件
+    buffered_handler = logging.handlers.MemoryHandler(capacity=1000, flushLevel=logging.ERROR,
+                                                      target=file_handler)
+    buffered_handler.setLevel(logging.DEBUG)
+    
     # 添加控制台处理器，输出到终端
     console_handler = logging.StreamHandler()
     console_handler.setLevel(logging.INFO)
@@ -124,12 +199,49 @@ def setup_logging(log_dir=None):
     console_handler.setFormatter(formatter)
     
     # 添加处理器到日志记录器
-    logger.addHandler(file_handler)
+    logger.addHandler(buffered_handler)
     logger.addHandler(console_handler)
     
+    # 记录是否存在控制台处理器（没有时log_print需要自行打印消息）
+    _HAS_CONSOLE = any(isinstance(handler, logging.StreamHandler) and not isinstance(handler, logging.FileHandler)
+                       for handler in logger.handlers)
+    
     logger.info(f"日志系统已初始化，日志文件: {log_file}")
     return logger
 
+def _init_worker(log_dir, oda_path, thread_workers):
+    """
+    进程池工作进程的初始化函数：设置日志系统、ODA路径和线程数
+    (Windows下子进程会重新导入本模块，主进程中修改过的全局变量不会被继承)
+    
+    参数:
+        log_dir: 日志文件保存目录
+        oda_path: ODA File Converter可执行文件的路径
+        thread_workers: 本进程内线程池的线程数
+    """
+    global ODA_PATH, THREAD_WORKERS
+    ODA_PATH = oda_path
+    THREAD_WORKERS = thread_workers
+    # 多个进程已经占满CPU核心，关闭OpenCV内部的线程池，避免线程数成倍超额
+    cv2.setNumThreads(1)
+    setup_logging(log_dir, tag=f"worker{os.getpid()}")
+
+def _process_file_in_worker(input_file, output_dir, img_size, min_room_area, preview_size):
+    """
+    在进程池工作进程中处理单个文件，参数同extract_rooms_from_dwg
+    工作进程退出时不会执行atexit，因此每个文件处理完后主动把缓冲的日志写入文件
+    
+    返回:
+        识别出的房间数量 (主进程只需要处理状态，不回传房间数据)
+    """
+    try:
+        rooms, _ = extract_rooms_from_dwg(input_file, output_dir, img_size, min_room_area,
+                                          preview_size=preview_size)
+        return len(rooms)
+    finally:
+        for handler in logger.handlers:
+            handler.flush()
+
 def log_print(message, level='info'):
     """
     同时向控制台输出消息并记录到日志文件
@@ -144,26 +256,30 @@ def log_print(message, level='info'):
     if logger is None:
         logger = setup_logging()
     
-    # 根据等级记录日志
-    if level == 'debug':
-        logger.debug(message)
-    elif level == 'info':
-        logger.info(message)
-    elif level == 'warning':
-        logger.warning(message)
-    elif level == 'error':
-        logger.error(message)
-    elif level == 'critical':
-        logger.critical(message)
-    else:
-        logger.info(message)
+    # 根据等级记录日志，未知等级按info处理；等级未启用时直接返回
+    level_int = _LEVEL_MAP.get(level, logging.INFO)
+    if not logger.isEnabledFor(level_int):
+        return
+    logger.log(level_int, message)
     
     # 如果没有控制台处理器（意味着消息不会自动打印到控制台），则打印消息
-    console_handler_exists = any(isinstance(handler, logging.StreamHandler) and not isinstance(handler, logging.FileHandler) 
-                               for handler in logger.handlers)
-    if not console_handler_exists:
+    if not _HAS_CONSOLE:
         print(message)
 
+def copy_to_current_dir(dxf_file):
+    """
+    在当前工作目录保存一份DXF文件，目标就是当前目录时跳过重复写入
+    
+    参数:
+        dxf_file: 已生成的DXF文件路径
+    """
+    current_dir_copy = os.path.join(os.getcwd(), os.path.basename(dxf_file))
+    # normcase处理Windows下路径大小写不敏感的情况
+    if os.path.normcase(os.path.abspath(current_dir_copy)) == os.path.normcase(os.path.abspath(dxf_file)):
+        return
+    shutil.copy2(dxf_file, current_dir_copy)
+    log_print(f"同时在当前工作目录保存了一份: {current_dir_copy}")
+
 def convert_dwg_to_dxf(dwg_file, dxf_file=None):
     """
     将DWG文件转换为DXF文件
@@ -202,26 +318,25 @@ def convert_dwg_to_dxf(dwg_file, dxf_file=None):
                 input_file = os.path.basename(dwg_file)
                 
                 # 正确的ODA转换命令格式
-                # 直接构建完整的命令字符串，确保路径正确引用
-                cmd_str = f'"{ODA_PATH}" "{input_dir}" "{output_dir}" ACAD2013 DXF 0 0 "*.DWG"'
+                # 以参数列表形式直接启动ODA，不经过shell解析，路径无需额外引用
+                cmd = [ODA_PATH, input_dir, output_dir, "ACAD2013", "DXF", "0", "0", "*.DWG"]
                 
-                log_print(f"尝试使用ODA File Converter转换: {cmd_str}")
+                # 日志中仍记录带引号的命令，便于手动复现
+                log_print(f'尝试使用ODA File Converter转换: "{ODA_PATH}" "{input_dir}" "{output_dir}" ACAD2013 DXF 0 0 "*.DWG"')
                 
-                # 使用shell=True执行命令字符串
-                subprocess.run(cmd_str, check=True, shell=True)
+                # Windows下不弹出控制台窗口
+                creationflags = subprocess.CREATE_NO_WINDOW if sys.platform == 'win32' else 0
+                subprocess.run(cmd, check=True, creationflags=creationflags)
                 
                 # 检查临时文件是否生成
                 converted_file = os.path.join(output_dir, os.path.splitext(input_file)[0] + ".dxf")
                 if os.path.exists(converted_file):
-                    # 将转换后的文件复制到目标位置
-                    shutil.copy2(converted_file, dxf_file)
+                    # 临时文件随后会被删除，直接移动到目标位置 (同一卷上只是重命名，不复制数据)
+                    shutil.move(converted_file, dxf_file)
                     log_print(f"转换成功，DXF文件已保存到: {dxf_file}")
                     
                     # 同时保存一份到当前工作目录
-                    current_dir_copy = os.path.join(os.getcwd(), os.path.basename(dxf_file))
-                    if os.path.abspath(current_dir_copy) != os.path.abspath(dxf_file):
-                        shutil.copy2(converted_file, current_dir_copy)
-                        log_print(f"同时在当前工作目录保存了一份: {current_dir_copy}")
+                    copy_to_current_dir(dxf_file)
                     
                     return dxf_file
                 
@@ -244,10 +359,7 @@ def convert_dwg_to_dxf(dwg_file, dxf_file=None):
                 log_print(f"转换成功，DXF文件已保存到: {dxf_file}")
                 
                 # 同时保存一份到当前工作目录
-                current_dir_copy = os.path.join(os.getcwd(), os.path.basename(dxf_file))
-                if os.path.abspath(current_dir_copy) != os.path.abspath(dxf_file):
-                    shutil.copy2(dxf_file, current_dir_copy)
-                    log_print(f"同时在当前工作目录保存了一份: {current_dir_copy}")
+                copy_to_current_dir(dxf_file)
                     
                 return dxf_file
         except Exception as e:
@@ -283,7 +395,7 @@ def generate_original_preview(dxf_file, output_file, img_size=3000):
     参数:
         dxf_file: DXF文件路径
         output_file: 预览图输出路径
-        img_size: 预览图尺寸
+        img_size: 预览图绘制尺寸，线宽和字号以3000为参考尺寸等比缩放
     
     返回:
         extents: 图纸范围 [xmin, ymin, xmax, ymax]
@@ -293,43 +405,20 @@ def generate_original_preview(dxf_file, output_file, img_size=3000):
         # 读取DXF文件
         original_doc = ezdxf.readfile(dxf_file)
         
+        # 遍历一次模型空间，范围计算和线条提取共用同一份实体记录
+        records = scan_entities(original_doc.modelspace())
+        
         # 获取绘图范围
-        extents = get_drawing_extents(original_doc.modelspace())
+        extents = get_drawing_extents(None, records=records)
         if not extents:
             extents = (0, 0, 1000, 1000)
             log_print("警告: 无法获取绘图范围，使用默认范围")
         
-        # 提取所有实体线条
-        all_entities = []
-        for entity in original_doc.modelspace():
-            try:
-                if entity.dxftype() == 'LINE':
-                    start = (entity.dxf.start.x, entity.dxf.start.y)
-                    end = (entity.dxf.end.x, entity.dxf.end.y)
-                    all_entities.append([(start, end)])
-                elif entity.dxftype() == 'LWPOLYLINE':
-                    points = [(point[0], point[1]) for point in entity.get_points()]
-                    if len(points) >= 2:
-                        segments = []
-                        for i in range(len(points) - 1):
-                            segments.append((points[i], points[i+1]))
-                        if entity.is_closed and len(points) > 2:
-                            segments.append((points[-1], points[0]))
-                        all_entities.append(segments)
-                elif entity.dxftype() in ('ARC', 'CIRCLE', 'ELLIPSE', 'SPLINE'):
-                    # 这些实体类型通常使用更复杂的绘制方法，但为简单起见，我们至少标记它们的位置
-                    if hasattr(entity.dxf, 'center'):
-                        center = (entity.dxf.center.x, entity.dxf.center.y)
-                        radius = getattr(entity.dxf, 'radius', 2)  # 默认半径
-                        # 添加一个小十字表示中心点
-                        size = radius / 2
-                        all_entities.append([((center[0]-size, center[1]), (center[0]+size, center[1]))])
-                        all_entities.append([((center[0], center[1]-size), (center[0], center[1]+size))])
-            except Exception as e:
-                log_print(f"提取实体时出错: {e}", 'debug')
+        # 提取所有实体线条，并标记圆弧等实体的中心位置
+        all_entities = records_to_polylines(records, mark_centers=True)
         
         # 创建预览图像
-        preview_img = create_preview_image(all_entities, extents, output_file, img_size)
+        preview_img = create_preview_image(all_entities, extents, output_file, img_size, reference_size=3000)
         
         if preview_img is not None:
             log_print(f"原始DXF文件预览图已保存到: {output_file}")
@@ -339,7 +428,45 @@ def generate_original_preview(dxf_file, output_file, img_size=3000):
         log_print(f"生成原始预览图像时出错: {e}", 'error')
         return None
 
-def extract_rooms_from_dwg(input_file, output_dir=None, img_size=1024, min_room_area=1.0, max_room_area=None):
+def save_room_outputs(index, room, extents, img_size, output_dir):
+    """
+    保存单个房间的图像和DXF文件
+    
+    参数:
+        index: 房间序号（从0开始）
+        room: 房间多边形顶点列表
+        extents: 图纸范围 [xmin, ymin, xmax, ymax]
+        img_size: 图像大小
+        output_dir: 输出目录
+    
+    返回:
+        成功返回True，失败返回False
+    """
+    try:
+        # 创建输出文件名
+        output_file = os.path.join(output_dir, f"room_{index+1}")
+        
+        # 保存房间图像 (use final_extents)
+        # 在当前线程复用的缓冲区上绘制，直接得到0/255的uint8图像
+        room_png = room_to_image(room, extents, img_size, img_size,
+                                 out=get_buffer('room', (img_size, img_size)))
+        
+        # 直接编码写出，跳过matplotlib的绘制和PNG合成；不再绘制标签，保持0/255的纯二值掩码 (序号见文件名)
+        if not write_png(room_png, f"{output_file}.png"):
+            log_print(f"保存房间 {index+1} 图像失败: {output_file}.png", 'warning')
+        
+        # 将房间轮廓保存为单独的DXF
+        save_room_to_dxf(room, f"{output_file}.dxf")
+        
+        log_print(f"房间 {index+1} 处理完成")
+        return True
+    
+    except Exception as e:
+        log_print(f"处理房间 {index+1} 时出错: {e}")
+        return False
+
+def extract_rooms_from_dwg(input_file, output_dir=None, img_size=1024, min_room_area=1.0, max_room_area=None,
+                           preview_size=3000):
     """
     从DWG文件中提取房间轮廓
     
@@ -349,6 +476,7 @@ def extract_rooms_from_dwg(input_file, output_dir=None, img_size=1024, min_room_
         img_size: 图像大小
         min_room_area: 最小房间面积，占图纸总面积的百分比(%)
         max_room_area: 最大房间面积，占图纸总面积的百分比(%)，如果为None则默认为60%
+        preview_size: 原始DXF预览图的绘制尺寸，取更小的值可加快绘制，线宽和字号会随之等比缩小
     
     返回:
         rooms: 房间多边形列表
@@ -388,7 +516,7 @@ def extract_rooms_from_dwg(input_file, output_dir=None, img_size=1024, min_room_
         
         # 0. 输出原始DXF文件的预览图 - 使用独立函数
         original_preview_file = os.path.join(output_dir, "original_preview.png")
-        generate_original_preview(input_file_to_process, original_preview_file, img_size=3000)
+        generate_original_preview(input_file_to_process, original_preview_file, img_size=preview_size)
         
         # 1. 预处理DXF文件
         preprocessed_file = os.path.join(output_dir, "preprocessed.dxf")
@@ -428,29 +556,12 @@ def extract_rooms_from_dwg(input_file, output_dir=None, img_size=1024, min_room_
         
         # 5. 保存每个房间的单独图像
         log_print(f"保存 {len(rooms)} 个识别出的房间图像和DXF...")
-        for i, room in enumerate(rooms):
-            try:
-                # 创建输出文件名
-                output_file = os.path.join(output_dir, f"room_{i+1}")
-                
-                # 保存房间图像 (use final_extents)
-                room_img = room_to_image(room, final_extents, img_size, img_size)
-                
-                # 使用辅助函数保存房间图像
-                plt.figure(figsize=(10, 10))
-                plt.imshow(room_img, cmap='gray')
-                plt.title(f"Room {i+1}")
-                save_image(room_img, f"{output_file}.png", title=f"房间 {i+1}")
-                plt.close()
-                
-                # 将房间轮廓保存为单独的DXF
-                save_room_to_dxf(room, f"{output_file}.dxf")
-                
-                log_print(f"房间 {i+1} 处理完成")
-            
-            except Exception as e:
-                log_print(f"处理房间 {i+1} 时出错: {e}")
-                continue
+        # 各房间的栅格化、PNG和DXF写出互不依赖，使用线程池并行处理
+        # (cv2和文件写入在C代码中释放GIL，线程即可获得并行收益)
+        process_room = functools.partial(save_room_outputs, extents=final_extents,
+                                         img_size=img_size, output_dir=output_dir)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=THREAD_WORKERS) as executor:
+            list(executor.map(process_room, range(len(rooms)), rooms))
         
         log_print(f"处理完成，已识别 {len(rooms)} 个房间，结果保存在 {output_dir}")
         
@@ -458,95 +569,148 @@ def extract_rooms_from_dwg(input_file, output_dir=None, img_size=1024, min_room_
         return rooms, final_extents
         
     finally:
-        # 清理matplotlib缓存
-        plt.close('all')
+        # 清理matplotlib缓存 (只在matplotlib已被加载时才需要)
+        if 'matplotlib.pyplot' in sys.modules:
+            sys.modules['matplotlib.pyplot'].close('all')
         
         # 释放内存
         gc.collect()
 
-def get_drawing_extents(modelspace):
-    """获取图纸的边界范围"""
-    min_x, min_y = float('inf'), float('inf')
-    max_x, max_y = float('-inf'), float('-inf')
+def scan_entities(modelspace):
+    """
+    遍历一次模型空间，提取每个实体的类型和坐标
+    
+    范围计算和预览图线条提取都使用这份记录，避免对模型空间进行多次遍历
     
-    entity_count = 0
+    参数:
+        modelspace: ezdxf模型空间
+    
+    返回:
+        记录列表，每条记录为字典:
+        {'type': 实体类型, 'pts': 顶点数组(Nx2)或None, 'closed': 是否闭合,
+         'center': 圆心(x, y)或None, 'radius': 半径或None}
+    """
+    records = []
     
     for entity in modelspace:
-        if hasattr(entity, 'get_points'):
-            try:
-                points = entity.get_points()
-                for point in points:
-                    min_x = min(min_x, point[0])
-                    min_y = min(min_y, point[1])
-                    max_x = max(max_x, point[0])
-                    max_y = max(max_y, point[1])
-                    entity_count += 1
-            except Exception as e:
-                log_print(f"警告: 处理实体点时出错: {e}", 'debug')  # 改为debug级别
-        # 特别处理Circle实体
-        elif entity.dxftype() == 'CIRCLE' and hasattr(entity.dxf, 'center') and hasattr(entity.dxf, 'radius'):
-            try:
-                # 直接使用圆心和半径计算边界
+        try:
+            etype = entity.dxftype()
+            record = {'type': etype, 'pts': None, 'closed': False, 'center': None, 'radius': None}
+            
+            # LINE是图纸中最常见的实体，放在最前面判断，直接使用起点和终点
+            if etype == 'LINE':
+                start = entity.dxf.start
+                end = entity.dxf.end
+                record['pts'] = np.array([[start.x, start.y], [end.x, end.y]])
+            elif hasattr(entity, 'get_points'):
+                record['pts'] = np.asarray(entity.get_points('xy'), dtype=np.float64).reshape(-1, 2)
+                record['closed'] = bool(getattr(entity, 'is_closed', False))
+            # POLYLINE等实体的vertices是顶点列表 (圆、圆弧等实体的vertices是需要参数的方法，跳过)
+            elif hasattr(entity, 'vertices') and not callable(entity.vertices):
+                points = []
+                for vertex in entity.vertices:
+                    if hasattr(vertex, 'dxf') and hasattr(vertex.dxf, 'location'):
+                        point = vertex.dxf.location
+                        points.append((point[0], point[1]))
+                record['pts'] = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+                record['closed'] = bool(getattr(entity, 'is_closed', False))
+            
+            # 圆、圆弧、椭圆等实体记录圆心和半径 (只有圆和圆弧有半径属性)
+            if etype in ('CIRCLE', 'ARC'):
                 center = entity.dxf.center
-                radius = entity.dxf.radius
-                min_x = min(min_x, center.x - radius)
-                min_y = min(min_y, center.y - radius)
-                max_x = max(max_x, center.x + radius)
-                max_y = max(max_y, center.y + radius)
-                entity_count += 1
-            except Exception as e:
-                log_print(f"警告: 处理Circle实体时出错: {e}", 'debug')  # 使用debug级别
-        elif hasattr(entity, 'vertices'):
-            # 检查vertices是否为方法或属性
-            try:
-                vertices = entity.vertices
-                # 如果是方法，则调用它，对Circle类型特殊处理
-                if callable(vertices):
-                    # 避免对Circle调用vertices()方法时缺少angles参数
-                    if entity.dxftype() == 'CIRCLE':
-                        # 跳过Circle实体的vertices处理(因为前面已经特别处理过了)
-                        continue
-                    else:
-                        vertices = vertices()
-                
-                # 确保vertices是可迭代的
-                if hasattr(vertices, '__iter__'):
-                    for vertex in vertices:
-                        try:
-                            if hasattr(vertex, 'dxf') and hasattr(vertex.dxf, 'location'):
-                                point = vertex.dxf.location
-                                min_x = min(min_x, point[0])
-                                min_y = min(min_y, point[1])
-                                max_x = max(max_x, point[0])
-                                max_y = max(max_y, point[1])
-                                entity_count += 1
-                        except Exception as e:
-                            log_print(f"警告: 处理顶点时出错: {e}", 'debug')  # 改为debug级别
-            except Exception as e:
-                # 将日志级别改为debug，防止打印到控制台
-                log_print(f"警告: 访问实体vertices时出错: {e}", 'debug')
+                record['center'] = (center.x, center.y)
+                record['radius'] = entity.dxf.radius
+            elif etype != 'LINE' and hasattr(entity.dxf, 'center'):
+                center = entity.dxf.center
+                record['center'] = (center.x, center.y)
+            
+            records.append(record)
+        except Exception as e:
+            log_print(f"警告: 读取实体时出错: {e}", 'debug')  # 使用debug级别
+    
+    return records
+
+def records_to_polylines(records, mark_centers=False):
+    """
+    将scan_entities的实体记录转换为预览用的折线列表
+    
+    参数:
+        records: scan_entities返回的实体记录
+        mark_centers: 是否为圆弧、圆、椭圆、样条曲线添加中心十字标记
     
-    if entity_count == 0:
+    返回:
+        折线列表，每条折线是一个顶点数组(Nx2)
+    """
+    polylines = []
+    
+    for record in records:
+        etype = record['type']
+        if etype in ('LINE', 'LWPOLYLINE'):
+            points = record['pts']
+            if len(points) >= 2:
+                # 闭合多段线在末尾补上起点，绘制时无需再拆分线段
+                if record['closed'] and len(points) > 2:
+                    points = np.vstack([points, points[:1]])
+                polylines.append(points)
+        elif mark_centers and etype in ('ARC', 'CIRCLE', 'ELLIPSE', 'SPLINE'):
+            # 这些实体类型通常使用更复杂的绘制方法，但为简单起见，我们至少标记它们的位置
+            if record['center'] is not None:
+                cx, cy = record['center']
+                radius = record['radius'] if record['radius'] is not None else 2  # 默认半径
+                # 添加一个小十字表示中心点
+                size = radius / 2
+                polylines.append(np.array([[cx - size, cy], [cx + size, cy]]))
+                polylines.append(np.array([[cx, cy - size], [cx, cy + size]]))
+    
+    return polylines
+
+def get_drawing_extents(modelspace, records=None):
+    """
+    获取图纸的边界范围
+    
+    参数:
+        modelspace: ezdxf模型空间
+        records: 可选，scan_entities已经生成的实体记录，传入时不再重新遍历模型空间
+    """
+    if records is None:
+        records = scan_entities(modelspace)
+    
+    # 先收集每个实体的坐标数组 (Nx2)，最后用numpy一次性求最值
+    buffers = []
+    
+    for record in records:
+        if record['pts'] is not None:
+            if len(record['pts']):
+                buffers.append(record['pts'])
+        # 特别处理Circle实体，直接使用圆心和半径计算边界
+        elif record['type'] == 'CIRCLE' and record['center'] is not None and record['radius'] is not None:
+            cx, cy = record['center']
+            radius = record['radius']
+            buffers.append(np.array([[cx - radius, cy - radius], [cx + radius, cy + radius]]))
+    
+    if not buffers:
         return None
     
-    return min_x, min_y, max_x, max_y
+    pts = np.concatenate(buffers, axis=0)
+    min_x, min_y = pts.min(axis=0)
+    max_x, max_y = pts.max(axis=0)
+    
+    return float(min_x), float(min_y), float(max_x), float(max_y)
 
 def is_valid_room(vertices, min_area=1.0):
     """
     检查多边形是否可能是一个房间(基于面积和复杂性)
     """
-    # 安全检查
-    if not vertices or len(vertices) < 3:
+    # 安全检查 (vertices可以是列表或numpy数组)
+    if vertices is None or len(vertices) < 3:
         return False
     
     try:
-        # 计算多边形面积
-        area = 0
-        for i in range(len(vertices)):
-            j = (i + 1) % len(vertices)
-            area += vertices[i][0] * vertices[j][1]
-            area -= vertices[j][0] * vertices[i][1]
-        area = abs(area) / 2.0
+        # 计算多边形面积 (鞋带公式，向量化实现)
+        v = np.asarray(vertices, dtype=np.float64)
+        x, y = v[:, 0], v[:, 1]
+        area = np.dot(x[:-1], y[1:]) - np.dot(y[:-1], x[1:]) + x[-1] * y[0] - y[-1] * x[0]
+        area = abs(float(area)) / 2.0
         
         # 使用参数指定的最小面积阈值
         return area >= min_area
@@ -554,31 +718,67 @@ def is_valid_room(vertices, min_area=1.0):
         log_print(f"警告: 计算面积时出错: {e}")
         return False
 
-def room_to_image(room, extents, img_width, img_height):
+def get_buffer(tag, shape, dtype=np.uint8):
+    """
+    获取当前线程复用的图像缓冲区
+    
+    缓冲区按用途区分，不同用途之间不会互相覆盖；同一用途在同一线程中下次获取时会被覆盖，
+    因此只能用于调用结束前就不再需要的中间图像。内容未初始化，由调用方清零或填充。
+    
+    参数:
+        tag: 缓冲区用途，如'room'、'walls'
+        shape: 图像形状
+        dtype: 数据类型
+        
+    返回:
+        numpy缓冲区，首次获取或形状/类型变化时分配
+    """
+    pool = getattr(_image_buffers, 'pool', None)
+    if pool is None:
+        pool = _image_buffers.pool = {}
+    key = (tag, tuple(shape), np.dtype(dtype))
+    buf = pool.get(key)
+    if buf is None:
+        # 同一用途只保留最新尺寸的缓冲区
+        for old_key in [k for k in pool if k[0] == tag]:
+            del pool[old_key]
+        buf = pool[key] = np.empty(shape, dtype=dtype)
+    return buf
+
+def room_to_image(room, extents, img_width, img_height, out=None):
     """
     将房间多边形转换为二进制图像
+    
+    参数:
+        out: 可选的预分配uint8缓冲区，传入时清零后在其上绘制并直接返回(0/255)，
+             不再额外生成布尔掩码
     """
     try:
         min_x, min_y, max_x, max_y = extents
         
-        # 创建空白图像
-        img = np.zeros((img_height, img_width), dtype=np.uint8)
+        # 复用缓冲区或创建空白图像
+        if out is not None:
+            img = out
+            img.fill(0)
+        else:
+            img = np.zeros((img_height, img_width), dtype=np.uint8)
         
-        # 转换坐标到图像空间
-        scaled_room = []
-        for x, y in room:
-            px = int((x - min_x) / (max_x - min_x) * (img_width - 1))
-            py = int((y - min_y) / (max_y - min_y) * (img_height - 1))
-            scaled_room.append((px, py))
+        # 转换坐标到图像空间 (对所有顶点一次性计算)
+        pts = np.asarray(room, dtype=np.float64)
+        px = (pts[:, 0] - min_x) / (max_x - min_x) * (img_width - 1)
+        py = (pts[:, 1] - min_y) / (max_y - min_y) * (img_height - 1)
         
         # 绘制填充多边形
-        poly = np.array(scaled_room, dtype=np.int32)
+        poly = np.stack([px, py], axis=1).astype(np.int32)
         cv2.fillPoly(img, [poly], 255)
         
-        return img > 0
+        return img if out is not None else img > 0
     except Exception as e:
         log_print(f"警告: 转换房间到图像时出错: {e}")
         # 返回空图像
+        if out is not None:
+            out.fill(0)
+            return out
         return np.zeros((img_height, img_width), dtype=bool)
 
 def save_skeleton_to_dxf(coords, output_file):
@@ -625,17 +825,17 @@ def preprocess_dwg(dxf_file, output_dxf=None):
         log_print(f"找到 {len(layers_info)} 个图层")
         
         # 2. 识别需要保留的图层(墙体和门窗)
-        relevant_layers = identify_wall_layers(layers_info)
+        relevant_layers, _ = identify_wall_layers(layers_info, record_hits=True)
         # log_print(f"将保留 {len(relevant_layers)} 个图层: {', '.join(relevant_layers)}")
         
         # 记录清理前的实体数量
-        original_entities = len(list(doc.modelspace()))
+        original_entities = len(doc.modelspace())
         
         # 3. 清理不需要的图层和实体
         cleaned_doc = clean_layers(doc, keep_layers=relevant_layers)
         
         # 记录清理后的实体数量
-        remaining_entities = len(list(cleaned_doc.modelspace()))
+        remaining_entities = len(cleaned_doc.modelspace())
         log_print(f"清理图层完成：从 {original_entities} 个实体减少到 {remaining_entities} 个实体，清理率: {(original_entities - remaining_entities) / original_entities * 100:.1f}%")
         
         # 4. 修复断开的线条 - 临时注释掉此步骤
@@ -650,31 +850,17 @@ def preprocess_dwg(dxf_file, output_dxf=None):
             
             # 同时保存预览图像
             try:
+                # 遍历一次模型空间，范围计算和墙体提取共用同一份实体记录
+                records = scan_entities(repaired_doc.modelspace())
+                
                 # 获取绘图范围
-                extents = get_drawing_extents(repaired_doc.modelspace())
+                extents = get_drawing_extents(None, records=records)
                 if not extents:
                     extents = (0, 0, 1000, 1000)
                     log_print("警告: 无法获取绘图范围，使用默认范围")
                 
                 # 提取墙体线条
-                walls = []
-                for entity in repaired_doc.modelspace():
-                    try:
-                        if entity.dxftype() == 'LINE':
-                            start = (entity.dxf.start.x, entity.dxf.start.y)
-                            end = (entity.dxf.end.x, entity.dxf.end.y)
-                            walls.append([(start, end)])
-                        elif entity.dxftype() == 'LWPOLYLINE':
-                            points = [(point[0], point[1]) for point in entity.get_points()]
-                            if len(points) >= 2:
-                                segments = []
-                                for i in range(len(points) - 1):
-                                    segments.append((points[i], points[i+1]))
-                                if entity.is_closed and len(points) > 2:
-                                    segments.append((points[-1], points[0]))
-                                walls.append(segments)
-                    except Exception as e:
-                        log_print(f"提取墙体时出错: {e}")
+                walls = records_to_polylines(records)
                 
                 # 创建预览图像文件路径 - 与DXF文件同名但扩展名为.png
                 preview_file = os.path.splitext(output_dxf)[0] + "_preview.png"
@@ -694,15 +880,16 @@ def preprocess_dwg(dxf_file, output_dxf=None):
         log_print(f"预处理DXF文件时出错: {e}")
         return None
 
-def create_preview_image(walls, extents, output_file, img_size=2000):
+def create_preview_image(walls, extents, output_file, img_size=2000, reference_size=None):
     """
     创建墙体线条的预览图像
     
     参数:
-        walls: 墙体线条列表
+        walls: 墙体折线列表，每条折线是一个顶点序列 [(x1,y1), (x2,y2), ...]
         extents: 图纸范围 (min_x, min_y, max_x, max_y)
         output_file: 输出文件路径
-        img_size: 图像尺寸
+        img_size: 绘制图像的尺寸
+        reference_size: 可选，线宽和字号对应的参考尺寸，按img_size/reference_size等比缩放，为None时不缩放
     
     返回:
         生成的图像
@@ -710,14 +897,19 @@ def create_preview_image(walls, extents, output_file, img_size=2000):
     # log_print(f"生成预处理预览图像: {output_file}")
     
     try:
+        # 线宽、字号和标题位置按参考尺寸等比缩放，避免小尺寸绘制的图像保存缩小后线条和标题过粗
+        factor = img_size / reference_size if reference_size else 1.0
+        thickness = max(1, round(2 * factor))
+        text_org = (round(50 * factor), round(50 * factor))
+        
         # 创建空白RGB图像
         img = np.ones((img_size, img_size, 3), dtype=np.uint8) * 255
         
         # 检查墙体数据是否为空
         if not walls:
             log_print("警告: 没有墙体数据，生成空白预览图", 'warning')
-            cv2.putText(img, "预处理文件 (无墙体数据)", (50, 50), cv2.FONT_HERSHEY_COMPLEX, 
-                       1.0, (0, 0, 0), 2, cv2.LINE_AA)
+            cv2.putText(img, "预处理文件 (无墙体数据)", text_org, cv2.FONT_HERSHEY_COMPLEX, 
+                       factor, (0, 0, 0), thickness, cv2.LINE_AA)
         else:
             # 检查范围是否有效
             if extents is None or len(extents) != 4:
@@ -744,32 +936,29 @@ def create_preview_image(walls, extents, output_file, img_size=2000):
             offset_x = (img_size - width * scale) / 2
             offset_y = (img_size - height * scale) / 2
             
-            # 坐标转换函数，将原始坐标转换为图像坐标
-            def transform(point):
-                try:
-                    x = int(offset_x + (point[0] - min_x) * scale)
-                    y = int(img_size - (offset_y + (point[1] - min_y) * scale))  # Y坐标反转
-                    # 确保坐标在图像范围内
-                    x = max(0, min(x, img_size - 1))
-                    y = max(0, min(y, img_size - 1))
-                    return (x, y)
-                except Exception as e:
-                    log_print(f"坐标转换出错: {e}, 点: {point}")
-                    return (0, 0)  # 返回安全值
-            
-            # 绘制所有的墙体
+            # 将所有折线的顶点拼接为一个数组，一次性完成坐标转换
+            polylines = [np.asarray(wall, dtype=np.float64).reshape(-1, 2) for wall in walls]
+            polylines = [pts for pts in polylines if len(pts) >= 2]
             walls_drawn = 0
-            for wall in walls:
-                for segment in wall:
-                    start, end = segment
-                    cv2.line(img, transform(start), transform(end), (0, 0, 0), 2)
-                    walls_drawn += 1
+            
+            if polylines:
+                lengths = [len(pts) for pts in polylines]
+                pts = np.concatenate(polylines, axis=0)
+                
+                # 坐标转换，将原始坐标转换为图像坐标 (Y坐标反转)，并确保坐标在图像范围内
+                xs = np.clip(offset_x + (pts[:, 0] - min_x) * scale, 0, img_size - 1)
+                ys = np.clip(img_size - (offset_y + (pts[:, 1] - min_y) * scale), 0, img_size - 1)
+                pixels = np.stack([xs, ys], axis=1).astype(np.int32)
+                
+                # 按折线拆分后一次性绘制所有的墙体
+                cv2.polylines(img, np.split(pixels, np.cumsum(lengths)[:-1]), False, (0, 0, 0), thickness)
+                walls_drawn = len(pts) - len(polylines)
             
             log_print(f"已绘制 {walls_drawn} 条墙体线段")
         
         # 添加标题
-        cv2.putText(img, "预处理文件预览", (50, 50), cv2.FONT_HERSHEY_COMPLEX, 
-                   1.0, (0, 0, 0), 2, cv2.LINE_AA)
+        cv2.putText(img, "预处理文件预览", text_org, cv2.FONT_HERSHEY_COMPLEX, 
+                   factor, (0, 0, 0), thickness, cv2.LINE_AA)
         
         # 使用辅助函数保存图像
         save_image(img, output_file, title="预处理文件预览")
@@ -818,6 +1007,7 @@ def analyze_layers(doc):
             
             layers_info[layer_name] = {
                 'entity_types': {},
+                'name_lower': layer_name.lower(),  # 预先小写化，供关键词匹配复用
                 'color': color,
                 'is_on': not layer.is_off if hasattr(layer, 'is_off') else True,
                 'is_frozen': layer.is_frozen if hasattr(layer, 'is_frozen') else False,
@@ -826,214 +1016,360 @@ def analyze_layers(doc):
         except Exception as e:
             log_print(f"警告: 处理图层 {layer} 时出错: {e}")
             # 添加图层，但使用默认值
-            layers_info[layer.dxf.name if hasattr(layer.dxf, 'name') else f'未知图层_{len(layers_info)}'] = {
+            layer_name = layer.dxf.name if hasattr(layer.dxf, 'name') else f'未知图层_{len(layers_info)}'
+            layers_info[layer_name] = {
                 'entity_types': {},
+                'name_lower': layer_name.lower(),
                 'color': 7,  # 默认颜色(白色)
                 'is_on': True,
                 'is_frozen': False,
                 'linetype': 'CONTINUOUS'
             }
     
-    # 分析各图层中的实体
-    for entity in doc.entitydb.values():
-        if hasattr(entity, 'dxf') and hasattr(entity.dxf, 'layer'):
-            layer_name = entity.dxf.layer
-            entity_type = entity.dxftype()
-            
-            # 如果图层不在字典中（可能是因为图层表中没有定义），添加它
-            if layer_name not in layers_info:
-                layers_info[layer_name] = {
-                    'entity_types': {},
-                    'color': 7,  # 默认颜色
-                    'is_on': True,
-                    'is_frozen': False,
-                    'linetype': 'CONTINUOUS'
-                }
-            
-            # 更新该图层中此类实体的数量
-            if entity_type in layers_info[layer_name]['entity_types']:
-                layers_info[layer_name]['entity_types'][entity_type] += 1
-            else:
-                layers_info[layer_name]['entity_types'][entity_type] = 1
+    # 分析各图层中的实体：只遍历一次模型空间（比entitydb小得多，不含图纸空间和块定义），
+    # 按(图层, 实体类型)计数；Counter直接消费生成器，计数在C中完成，不再逐个实体做两级字典查找
+    pair_counts = Counter((entity.dxf.layer, entity.dxftype()) for entity in doc.modelspace())
+    counts = defaultdict(dict)
+    for (layer_name, entity_type), count in pair_counts.items():
+        counts[layer_name][entity_type] = count
+    
+    for layer_name, type_counts in counts.items():
+        # 如果图层不在字典中（可能是因为图层表中没有定义），添加它
+        if layer_name not in layers_info:
+            layers_info[layer_name] = {
+                'entity_types': {},
+                'name_lower': layer_name.lower(),
+                'color': 7,  # 默认颜色
+                'is_on': True,
+                'is_frozen': False,
+                'linetype': 'CONTINUOUS'
+            }
+        
+        # 更新该图层中各类实体的数量
+        layers_info[layer_name]['entity_types'] = type_counts
     
     return layers_info
 
-def identify_wall_layers(layers_info):
+# ===== 图层分类关键词 =====
+# 墙体相关关键词
+WALL_KEYWORDS = ['WALL', 'wall', '墙', '墙体', 'A-WALL', 'S-WALL', 'WALX', 'ARCH-WALL', '墙线', 
+                'QA', 'QZ', 'MQ', 'QIANG', 'BZ', '隔墙', '砖墙','柱',
+                '建-墙', '结构-墙', '建筑-墙', '剪力墙', '承重墙', '隔墙-砖墙', '隔墙—砖墙', 'I—隔墙']
+
+# 门窗相关关键词
+DOOR_WINDOW_KEYWORDS = ['DOOR', 'door', '门', 'A-DOOR', 'WINDOW', 'window', '窗', 'A-WINDOW', 
+                       'DOOR_WINDOW', 'OPENING', '建-窗', '建-门', 'I—平面—门', 'I-平面-窗', '门窗']
+
+# 房间相关关键词
+ROOM_KEYWORDS = ['ROOM', 'Room', 'room', '房间', '房', 'SPACE', 'Space', 'space', '空间', 
+                 'AREA', 'Area', 'area', '区域', 'ARCH-ROOM', 'A-ROOM', 'A-ZONE']
+
+# 文字和标注相关关键词
+TEXT_KEYWORDS = ['TEXT', 'DIM', 'TITLE', '标注', '文字', '标题', '编号', '图框', '图例', 
+                'ANNOTATION', 'LABEL', 'NUMBER', 'NOTE', '备注', 'MARK', '符号', 'SYMBOL']
+
+# 其他应排除的关键词
+EXCLUDE_KEYWORDS = [
+    # 家具相关
+    'FURN', 'furniture', '家具', 'DESK', 'TABLE', 'CHAIR', 'BED', 'SOFA', 
+    '桌', '椅', '床', '沙发', '柜', '橱', '移动家具', '室-家具', 'MOVABLE',
+    
+    # 设备相关
+    'EQUIP', 'EQUIPMENT', '设备', '洁具', '卫生间', '装饰', '灯', '灯具', 
+    '电气', 'ELEC', '暖通', 'HVAC', '给排水', 'PLUMBING', '空调', 'AC', 'AIR',
+    
+    # 装饰和结构元素
+    '地坪', '踏步', '栏杆', '分隔', '填充', '轮廓线', '面层线', '平顶',
+    'CEILING', '天花', 'FLOOR', '地面', 'STAIR', '楼梯', 'RAILING', '扶手', 
+    'DECORATION', '装饰', 'FINISHING', '饰面', 'PATTERN', '图案',
+    
+    # 其他非墙体图层
+    'GRID', '轴网', 'COLUMN', '柱', 'BEAM', '梁',
+    'LANDSCAPE', '景观', 'VEGETATION', '植被', 
+    'SITE', '场地', 'LINE', '线条', 'LAYOUT', '布局'
+]
+
+# 设备/装饰等特殊排除关键词 (未命中其他类别时使用)
+SPECIAL_EXCLUDE_KEYWORDS = ['灯', '洁具', '栏杆', '踏步', '暖通', '隔断', '家具']
+
+# 墙体提取时按图层名排除的家具、设备、标注等关键词 (区分大小写)
+FURNITURE_EQUIPMENT_KEYWORDS = ['家具', 'FURN', 'furniture', '设备', 'EQUIP', 'equipment', 
+                                '标注', 'TEXT', 'text', 'ANNO', 'annotation', '轴网', 
+                                'GRID', 'grid', '灯具', 'LIGHT', '卫生', 'TOILET', 
+                                'PLUMB', '管道', 'PIPE', '电气', 'ELEC']
+
+def _compile_keywords(keywords, lower=True):
+    """
+    将关键词列表编译为一个正则表达式，对小写化的图层名只需一次扫描即可判断是否命中任一关键词
+    
+    参数:
+        keywords: 关键词列表
+        lower: 是否将关键词小写化 (匹配时图层名也需小写化)，为False时按原样区分大小写匹配
+    
+    返回:
+        编译后的正则表达式
+    """
+    # 小写化后去重，按长度从长到短排列，使'A-WALL'之类的具体关键词先于'WALL'参与匹配
+    tokens = frozenset(keyword.lower() if lower else keyword for keyword in keywords)
+    if not tokens:
+        # 没有关键词时返回永不匹配的正则 (空的选择分支会匹配任意名称)
+        return re.compile('(?!)')
+    return re.compile('|'.join(re.escape(token) for token in sorted(tokens, key=lambda t: (-len(t), t))))
+
+# ===== 关键词命中统计 =====
+# 环境变量CAD_PROFILE=1时，记录各关键词在图层名中的命中次数并累加写入统计文件；
+# CAD_PROFILE=use时，只用统计中命中过的关键词编译正则，适合同一套制图规范的图纸批量处理
+CAD_PROFILE = os.environ.get('CAD_PROFILE', '').strip().lower()
+KEYWORD_PROFILE_FILE = os.path.join(os.path.dirname(FONT_CACHE_FILE), 'keyword_profile.json')
+
+# 参与统计的关键词类别
+PROFILED_KEYWORDS = {
+    'text': TEXT_KEYWORDS,
+    'wall': WALL_KEYWORDS,
+    'door_window': DOOR_WINDOW_KEYWORDS,
+    'exclude': EXCLUDE_KEYWORDS,
+    'special': SPECIAL_EXCLUDE_KEYWORDS,
+    'room': ROOM_KEYWORDS,
+}
+
+def load_keyword_profile():
+    """
+    读取关键词命中统计
+    
+    返回:
+        字典，键为关键词类别，值为 {小写关键词: 命中次数}；文件不存在或无法解析时返回空字典
+    """
+    try:
+        with open(KEYWORD_PROFILE_FILE, 'r', encoding='utf-8') as f:
+            profile = json.load(f)
+        return profile if isinstance(profile, dict) else {}
+    except Exception:
+        return {}
+
+def record_keyword_hits(names_lower):
+    """
+    统计一批小写化图层名中各关键词的命中次数，累加到统计文件中
+    
+    参数:
+        names_lower: 小写化的图层名列表
+    """
+    profile = load_keyword_profile()
+    for category, keywords in PROFILED_KEYWORDS.items():
+        hits = profile.setdefault(category, {})
+        for token in {keyword.lower() for keyword in keywords}:
+            hits[token] = hits.get(token, 0) + sum(1 for name in names_lower if token in name)
+    
+    try:
+        os.makedirs(os.path.dirname(KEYWORD_PROFILE_FILE), exist_ok=True)
+        with open(KEYWORD_PROFILE_FILE, 'w', encoding='utf-8') as f:
+            json.dump(profile, f, ensure_ascii=False, indent=1, sort_keys=True)
+    except Exception as e:
+        log_print(f"警告: 保存关键词命中统计失败: {e}", 'warning')
+
+def _profiled_keywords(category, profile):
+    """
+    按命中统计裁剪某一类别的关键词，没有该类别的统计或该类别关键词全未命中时保留完整列表
+    """
+    keywords = PROFILED_KEYWORDS[category]
+    hits = profile.get(category)
+    if not hits:
+        return keywords
+    # 全部未命中时裁剪结果为空，会编译成永不匹配的正则，相当于关闭该类识别，因此回退到完整列表
+    return [keyword for keyword in keywords if hits.get(keyword.lower(), 0) > 0] or keywords
+
+_KEYWORD_PROFILE = load_keyword_profile() if CAD_PROFILE == 'use' else {}
+
+# 模块加载时编译一次，所有调用共享
+_WALL_RE = _compile_keywords(_profiled_keywords('wall', _KEYWORD_PROFILE))
+_DOOR_WINDOW_RE = _compile_keywords(_profiled_keywords('door_window', _KEYWORD_PROFILE))
+_ROOM_RE = _compile_keywords(_profiled_keywords('room', _KEYWORD_PROFILE))
+_TEXT_RE = _compile_keywords(_profiled_keywords('text', _KEYWORD_PROFILE))
+_EXCLUDE_RE = _compile_keywords(_profiled_keywords('exclude', _KEYWORD_PROFILE))
+_SPECIAL_EXCLUDE_RE = _compile_keywords(_profiled_keywords('special', _KEYWORD_PROFILE))
+_FURNITURE_RE = _compile_keywords(FURNITURE_EQUIPMENT_KEYWORDS, lower=False)
+
+# 图层名称类别，按优先级从高到低排列：文字 > 墙体 > 门窗 > 排除 > 特殊排除
+LAYER_NAME_CATEGORIES = ('text', 'wall', 'door_window', 'exclude', 'special')
+_CATEGORY_RANK = {category: rank for rank, category in enumerate(LAYER_NAME_CATEGORIES)}
+# 合并为一个零宽前瞻正则：名称的每个位置上按优先级依次尝试各类别的关键词，
+# 命中的分组名即为该位置上优先级最高的类别，不同位置的关键词可以相互重叠
+_CATEGORY_RE = re.compile('(?=(?:' + '|'.join(
+    f'(?P<{category}>{pattern.pattern})'
+    for category, pattern in zip(LAYER_NAME_CATEGORIES,
+                                 (_TEXT_RE, _WALL_RE, _DOOR_WINDOW_RE, _EXCLUDE_RE, _SPECIAL_EXCLUDE_RE))
+) + '))')
+
+def classify_layer_name(name_lower):
+    """
+    一次扫描小写化的图层名，返回其命中关键词中优先级最高的类别
+    
+    参数:
+        name_lower: 小写化的图层名
+    
+    返回:
+        LAYER_NAME_CATEGORIES中的类别名，未命中任何关键词时返回None
+    """
+    best = len(LAYER_NAME_CATEGORIES)
+    for match in _CATEGORY_RE.finditer(name_lower):
+        rank = _CATEGORY_RANK[match.lastgroup]
+        if rank < best:
+            best = rank
+            if best == 0:
+                break
+    return LAYER_NAME_CATEGORIES[best] if best < len(LAYER_NAME_CATEGORIES) else None
+
+# 图层实体计数矩阵的列顺序
+LAYER_ENTITY_TYPES = ['LINE', 'LWPOLYLINE', 'POLYLINE', 'HATCH', 'TEXT', 'MTEXT',
+                      'ARC', 'CIRCLE', 'INSERT', 'SPLINE', 'ELLIPSE']
+
+def build_layer_arrays(layers_info):
+    """
+    将图层信息字典转换为按列存放的数组，便于对所有图层一次性做向量化判断
+    
+    参数:
+        layers_info: 图层信息字典 (analyze_layers的返回值)
+    
+    返回:
+        counts: (图层数, len(LAYER_ENTITY_TYPES)) 的实体计数矩阵，行顺序与layers_info的迭代顺序一致
+        is_on: 图层是否打开的布尔数组
+        is_frozen: 图层是否冻结的布尔数组
+    """
+    n = len(layers_info)
+    counts = np.zeros((n, len(LAYER_ENTITY_TYPES)), dtype=np.int64)
+    is_on = np.empty(n, dtype=bool)
+    is_frozen = np.empty(n, dtype=bool)
+    
+    for row, info in enumerate(layers_info.values()):
+        entity_types = info['entity_types']
+        counts[row] = [entity_types.get(entity_type, 0) for entity_type in LAYER_ENTITY_TYPES]
+        is_on[row] = info['is_on']
+        is_frozen[row] = info['is_frozen']
+    
+    return counts, is_on, is_frozen
+
+def identify_wall_layers(layers_info, record_hits=False):
     """
     识别可能的墙体图层、门窗图层和房间图层
     
     参数:
         layers_info: 图层信息字典
+        record_hits: 统计模式下是否记录关键词命中情况，每张图纸只应在原始图层表上记录一次
     
     返回:
-        保留的图层名称列表（墙体+门窗图层），同时识别房间图层但不包含在返回结果中
-    """
-    # 初始化各类图层列表
-    wall_layers = []       # 墙体图层
-    door_window_layers = [] # 门窗图层
-    room_layers = []       # 房间图层
-    excluded_layers = []   # 排除图层
-    text_layers = []       # 文字相关图层
-    
-    # ===== 关键词定义 =====
-    # 墙体相关关键词
-    wall_keywords = ['WALL', 'wall', '墙', '墙体', 'A-WALL', 'S-WALL', 'WALX', 'ARCH-WALL', '墙线', 
-                    'QA', 'QZ', 'MQ', 'QIANG', 'BZ', '隔墙', '砖墙','柱',
-                    '建-墙', '结构-墙', '建筑-墙', '剪力墙', '承重墙', '隔墙-砖墙', '隔墙—砖墙', 'I—隔墙']
-    
-    # 门窗相关关键词
-    door_window_keywords = ['DOOR', 'door', '门', 'A-DOOR', 'WINDOW', 'window', '窗', 'A-WINDOW', 
-                           'DOOR_WINDOW', 'OPENING', '建-窗', '建-门', 'I—平面—门', 'I-平面-窗', '门窗']
-    
-    # 房间相关关键词
-    room_keywords = ['ROOM', 'Room', 'room', '房间', '房', 'SPACE', 'Space', 'space', '空间', 
-                     'AREA', 'Area', 'area', '区域', 'ARCH-ROOM', 'A-ROOM', 'A-ZONE']
-    
-    # 文字和标注相关关键词
-    text_keywords = ['TEXT', 'DIM', 'TITLE', '标注', '文字', '标题', '编号', '图框', '图例', 
-                    'ANNOTATION', 'LABEL', 'NUMBER', 'NOTE', '备注', 'MARK', '符号', 'SYMBOL']
-    
-    # 其他应排除的关键词
-    exclude_keywords = [
-        # 家具相关
-        'FURN', 'furniture', '家具', 'DESK', 'TABLE', 'CHAIR', 'BED', 'SOFA', 
-        '桌', '椅', '床', '沙发', '柜', '橱', '移动家具', '室-家具', 'MOVABLE',
-        
-        # 设备相关
-        'EQUIP', 'EQUIPMENT', '设备', '洁具', '卫生间', '装饰', '灯', '灯具', 
-        '电气', 'ELEC', '暖通', 'HVAC', '给排水', 'PLUMBING', '空调', 'AC', 'AIR',
-        
-        # 装饰和结构元素
-        '地坪', '踏步', '栏杆', '分隔', '填充', '轮廓线', '面层线', '平顶',
-        'CEILING', '天花', 'FLOOR', '地面', 'STAIR', '楼梯', 'RAILING', '扶手', 
-        'DECORATION', '装饰', 'FINISHING', '饰面', 'PATTERN', '图案',
-        
-        # 其他非墙体图层
-        'GRID', '轴网', 'COLUMN', '柱', 'BEAM', '梁',
-        'LANDSCAPE', '景观', 'VEGETATION', '植被', 
-        'SITE', '场地', 'LINE', '线条', 'LAYOUT', '布局'
-    ]
+        all_layers: 保留的图层名称列表（墙体+门窗图层）
+        room_layers: 识别出的房间图层名称集合
+    """
+    # 初始化各类图层集合 (集合的成员判断和删除都是O(1)，只在输出日志时排序)
+    wall_layers = set()        # 墙体图层
+    door_window_layers = set() # 门窗图层
+    room_layers = set()        # 房间图层
+    excluded_layers = set()    # 排除图层
+    text_layers = set()        # 文字相关图层
+    
+    # ===== 基于实体类型的判断，对所有图层一次性向量化计算 =====
+    counts, is_on, is_frozen = build_layer_arrays(layers_info)
+    col = LAYER_ENTITY_TYPES.index
+    line_counts = counts[:, col('LINE')]
+    polyline_counts = counts[:, col('LWPOLYLINE')] + counts[:, col('POLYLINE')]
+    hatch_counts = counts[:, col('HATCH')]
+    text_counts = counts[:, col('TEXT')] + counts[:, col('MTEXT')]
+    
+    # 房间常用闭合多段线或填充表示：多段线或填充数量较多，而线条相对较少
+    room_shape_mask = (~is_frozen & ((polyline_counts > 5) | (hatch_counts > 0))
+                       & ((line_counts == 0) | (polyline_counts > 0.5 * line_counts)))
+    
+    # 可能的墙体图层：线条多，文本少，且图层打开、未冻结
+    all_line_counts = line_counts + polyline_counts
+    wall_shape_mask = ((all_line_counts > 20) & ((text_counts == 0) | (all_line_counts > 10 * text_counts))
+                       & is_on & ~is_frozen)
+    
+    # 每个图层名只扫描一次得到其优先级最高的类别，在第一步中填充
+    name_categories = {}
     
     # ===== 辅助函数 =====
-    def check_keywords(name, keywords):
-        """检查图层名称是否包含关键词列表中的任一关键词"""
-        name_lower = name.lower()
-        return any(keyword.lower() in name_lower for keyword in keywords)
-    
-    def is_text_layer(name):
+    def is_text_layer(layer_name):
         """判断是否为文字图层"""
-        return check_keywords(name, text_keywords) or '文字' in name or '编号' in name
+        # 文字类别优先级最高，命中文字关键词即归为文字图层
+        return name_categories[layer_name] == 'text'
     
-    def is_room_layer(name, info):
+    def is_room_layer(name_lower, row):
         """判断是否为房间图层"""
-        # 基于名称判断
-        if check_keywords(name, room_keywords):
-            return True
-        
-        # 基于实体类型判断 - 房间常用闭合多段线或填充表示
-        entity_types = info['entity_types']
-        if ('LWPOLYLINE' in entity_types or 'POLYLINE' in entity_types or 'HATCH' in entity_types) and \
-           not info['is_frozen']:
-            # 额外判断：房间图层通常不包含大量线条
-            line_count = entity_types.get('LINE', 0)
-            polyline_count = entity_types.get('LWPOLYLINE', 0) + entity_types.get('POLYLINE', 0)
-            hatch_count = entity_types.get('HATCH', 0)
-            
-            # 如果多段线或填充数量较多，而线条相对较少，可能是房间图层
-            if (polyline_count > 5 or hatch_count > 0) and (line_count == 0 or polyline_count / line_count > 0.5):
-                return True
-        
-        return False
+        # 基于名称判断，其次基于实体类型判断 (房间与其他类别不互斥，单独匹配)
+        return _ROOM_RE.search(name_lower) is not None or bool(room_shape_mask[row])
     
-    # ===== 第一步：预处理 - 识别文字、房间和其他基础图层 =====
-    for layer_name, info in layers_info.items():
+    # ===== 第一步：一次遍历完成各图层的分类 =====
+    for row, (layer_name, info) in enumerate(layers_info.items()):
+        name_lower = info['name_lower']
+        category = classify_layer_name(name_lower)
+        name_categories[layer_name] = category
+        
         # 检查是否为文字图层
-        if is_text_layer(layer_name):
-            text_layers.append(layer_name)
-            excluded_layers.append(layer_name)
+        if category == 'text':
+            text_layers.add(layer_name)
+            excluded_layers.add(layer_name)
             continue
             
         # 检查是否为房间图层
-        if is_room_layer(layer_name, info):
-            room_layers.append(layer_name)
-            # 注意：房间图层不自动加入排除列表，因为有些图层可能既是房间图层又是墙体图层
-            continue
-    
-    # ===== 第二步：主处理 - 识别墙体和门窗图层 =====
-    for layer_name, info in layers_info.items():
-        # 跳过已识别的文字图层
-        if layer_name in text_layers:
-            continue
+        # 注意：房间图层不自动加入排除列表，也不跳过后续判断，因为有些图层可能既是房间图层又是墙体图层
+        if is_room_layer(name_lower, row):
+            room_layers.add(layer_name)
         
-        # 判断墙体图层 (优先级最高)
-        if '隔墙' in layer_name or '砖墙' in layer_name or check_keywords(layer_name, wall_keywords):
-            wall_layers.append(layer_name)
+        # 判断墙体图层 (优先级最高，'隔墙'、'砖墙'已包含在墙体关键词中)
+        if category == 'wall':
+            wall_layers.add(layer_name)
             continue
         
-        # 判断门窗图层 (确保不是文字图层)
-        if check_keywords(layer_name, door_window_keywords) and not is_text_layer(layer_name):
-            door_window_layers.append(layer_name)
+        # 判断门窗图层 (文字类别优先级更高，这里不会是文字图层)
+        if category == 'door_window':
+            door_window_layers.add(layer_name)
             continue
         
-        # 判断排除图层
-        if check_keywords(layer_name, exclude_keywords) and not check_keywords(layer_name, wall_keywords):
-            excluded_layers.append(layer_name)
-            continue
-            
-        # 特殊情况检查
-        if any(keyword in layer_name for keyword in ['灯', '洁具', '栏杆', '踏步', '暖通', 
-                                                 ('隔断' if '墙' not in layer_name else ''), '家具']):
-            excluded_layers.append(layer_name)
+        # 判断排除图层及特殊情况 (墙体类别优先级更高，这里不会命中墙体关键词)
+        if category in ('exclude', 'special'):
+            excluded_layers.add(layer_name)
             continue
             
-        # 未分类图层，基于图层内容进行判断
-        entity_types = info['entity_types']
-        line_count = entity_types.get('LINE', 0) + entity_types.get('LWPOLYLINE', 0) + entity_types.get('POLYLINE', 0)
-        text_count = entity_types.get('TEXT', 0) + entity_types.get('MTEXT', 0)
-        
-        # 可能的墙体图层：线条多，文本少
-        if (line_count > 20 and (text_count == 0 or line_count / text_count > 10) 
-                and info['is_on'] and not info['is_frozen']):
-            wall_layers.append(layer_name)
+        # 未分类图层，基于图层内容进行判断 (已预先向量化计算)
+        if wall_shape_mask[row]:
+            wall_layers.add(layer_name)
         else:
-            excluded_layers.append(layer_name)
+            excluded_layers.add(layer_name)
     
-    # ===== 第三步：检查隔墙类型的图层是否被误排除，恢复它们 =====
-    for layer_name in list(excluded_layers):
-        if '隔墙' in layer_name or '砖墙' in layer_name:
-            excluded_layers.remove(layer_name)
-            if layer_name not in wall_layers:
-                wall_layers.append(layer_name)
-                log_print(f"从排除列表中恢复墙体图层: {layer_name}")
+    # ===== 第二步：检查隔墙类型的图层是否被误排除，恢复它们 =====
+    for layer_name in [name for name in excluded_layers if '隔墙' in name or '砖墙' in name]:
+        excluded_layers.discard(layer_name)
+        if layer_name not in wall_layers:
+            wall_layers.add(layer_name)
+            log_print(f"从排除列表中恢复墙体图层: {layer_name}")
     
-    # ===== 第四步：最终清理 - 确保图层分类的一致性 =====
+    # ===== 第三步：最终清理 - 确保图层分类的一致性 =====
     # 处理墙体图层
     for layer_name in list(wall_layers):
         # 如果是文字图层或已被排除的图层（除了特殊的隔墙和砖墙图层）
         if is_text_layer(layer_name) or (layer_name in excluded_layers and 
                                         '隔墙' not in layer_name and '砖墙' not in layer_name):
-            wall_layers.remove(layer_name)
+            wall_layers.discard(layer_name)
             if layer_name not in excluded_layers:
-                excluded_layers.append(layer_name)
+                excluded_layers.add(layer_name)
                 log_print(f"从墙体图层中移除非墙体图层: {layer_name}")
     
     # 处理门窗图层
     for layer_name in list(door_window_layers):
         # 门窗图层不应出现在排除图层中
         if layer_name in excluded_layers:
-            door_window_layers.remove(layer_name)
+            door_window_layers.discard(layer_name)
             log_print(f"从门窗图层中移除被排除的图层: {layer_name}")
         # 门窗图层不应是文字图层
         elif is_text_layer(layer_name):
-            door_window_layers.remove(layer_name)
+            door_window_layers.discard(layer_name)
             if layer_name not in excluded_layers:
-                excluded_layers.append(layer_name)
+                excluded_layers.add(layer_name)
                 log_print(f"从门窗图层中移除文字/编号图层: {layer_name}")
     
-    # ===== 第五步：处理房间图层与其他图层的关系 =====
+    # ===== 第四步：处理房间图层与其他图层的关系 =====
     # 记录既是房间图层又是墙体/门窗图层的情况
-    wall_room_overlap = [layer for layer in room_layers if layer in wall_layers]
-    door_room_overlap = [layer for layer in room_layers if layer in door_window_layers]
+    wall_room_overlap = sorted(room_layers & wall_layers)
+    door_room_overlap = sorted(room_layers & door_window_layers)
     
     if wall_room_overlap:
         log_print(f"警告：以下图层既被识别为墙体图层又被识别为房间图层: {', '.join(wall_room_overlap)}")
@@ -1042,16 +1378,20 @@ def identify_wall_layers(layers_info):
         log_print(f"警告：以下图层既被识别为门窗图层又被识别为房间图层: {', '.join(door_room_overlap)}")
     
     # 合并墙体和门窗图层
-    all_layers = list(set(wall_layers + door_window_layers))
+    all_layers = list(wall_layers | door_window_layers)
     
     # 输出日志
-    log_print(f"识别出的墙体图层: {', '.join(wall_layers)}")
-    log_print(f"识别出的门窗图层: {', '.join(door_window_layers)}")
-    log_print(f"识别出的房间图层: {', '.join(room_layers)}")
-    log_print(f"排除的非墙体图层: {', '.join(excluded_layers)}")
+    log_print(f"识别出的墙体图层: {', '.join(sorted(wall_layers))}")
+    log_print(f"识别出的门窗图层: {', '.join(sorted(door_window_layers))}")
+    log_print(f"识别出的房间图层: {', '.join(sorted(room_layers))}")
+    log_print(f"排除的非墙体图层: {', '.join(sorted(excluded_layers))}")
     # log_print(f"保留的总图层数: {len(all_layers)}")
     
-    return all_layers
+    # 统计模式下记录本次图纸中各关键词的命中情况
+    if record_hits and CAD_PROFILE == '1':
+        record_keyword_hits([info['name_lower'] for info in layers_info.values()])
+    
+    return all_layers, room_layers
 
 def clean_layers(doc, keep_layers):
     """
@@ -1073,6 +1413,9 @@ def clean_layers(doc, keep_layers):
     
     log_print(f"保留以下图层: {', '.join(keep_layers)}")
     
+    # 逐实体判断图层时使用集合查找，避免每个实体都线性扫描列表
+    keep_set = frozenset(keep_layers)
+    
     # 创建新文档
     new_doc = ezdxf.new(dxfversion=doc.dxfversion)
     
@@ -1099,20 +1442,13 @@ def clean_layers(doc, keep_layers):
     new_msp = new_doc.modelspace()
     source_msp = doc.modelspace()
     
-    # 初始化计数器
-    total_entities = 0
+    # 初始化计数器 (实体总数直接取模型空间的长度，不必逐个计数)
+    total_entities = len(source_msp)
     entities_kept = 0
     
-    # 先收集要保留的实体
-    entities_to_copy = []
-    
-    # 遍历源文档中的所有实体
-    for entity in source_msp:
-        total_entities += 1
-        
-        if hasattr(entity, 'dxf') and hasattr(entity.dxf, 'layer'):
-            if entity.dxf.layer in keep_layers:
-                entities_to_copy.append(entity)
+    # 先收集要保留的实体 (模型空间实体都有dxf.layer，一次列表推导完成筛选)
+    is_kept = keep_set.__contains__
+    entities_to_copy = [entity for entity in source_msp if is_kept(entity.dxf.layer)]
     
     # 使用transform.copies函数批量复制实体
     if entities_to_copy:
@@ -1127,213 +1463,21 @@ def clean_layers(doc, keep_layers):
             entities_kept = len(entities_to_copy)
         except Exception as e:
             log_print(f"使用transform.copies复制实体时出错: {e}")
-            # 如果批量复制失败，回退到单独处理每个实体
-            log_print("回退到逐个实体处理模式...")
-            entities_kept = 0
+            # 如果批量复制失败，回退到ezdxf的Importer批量导入，
+            # 它会一并导入实体引用的图层、线型和块定义，不需要逐类型重建实体
+            log_print("回退到Importer批量导入模式...")
+            from ezdxf.addons import Importer
             
-            # 手动逐个复制实体
-            for entity in entities_to_copy:
-                try:
-                    entity_type = entity.dxftype()
-                    
-                    if entity_type == 'LINE':
-                        new_entity = new_msp.add_line(
-                            start=entity.dxf.start,
-                            end=entity.dxf.end
-                        )
-                        new_entity.dxf.layer = entity.dxf.layer
-                        entities_kept += 1
-                    
-                    elif entity_type == 'LWPOLYLINE':
-                        points = list(entity.get_points())
-                        if points:
-                            new_entity = new_msp.add_lwpolyline(points)
-                            new_entity.dxf.layer = entity.dxf.layer
-                            if hasattr(entity, 'closed'):
-                                new_entity.closed = entity.closed
-                            entities_kept += 1
-                    
-                    elif entity_type == 'POLYLINE':
-                        try:
-                            vertices = []
-                            vertex_list = entity.vertices
-                            if callable(vertex_list):
-                                vertex_list = vertex_list()
-                                
-                            for vertex in vertex_list:
-                                if hasattr(vertex, 'dxf') and hasattr(vertex.dxf, 'location'):
-                                    vertices.append(vertex.dxf.location)
-                            
-                            if vertices:
-                                new_entity = new_msp.add_lwpolyline(vertices)
-                                new_entity.dxf.layer = entity.dxf.layer
-                                if hasattr(entity, 'is_closed') and entity.is_closed:
-                                    new_entity.closed = True
-                                entities_kept += 1
-                        except Exception as ve:
-                            log_print(f"警告: 处理POLYLINE顶点时出错: {ve}")
-                    
-                    elif entity_type == 'ARC':
-                        new_entity = new_msp.add_arc(
-                            center=entity.dxf.center,
-                            radius=entity.dxf.radius,
-                            start_angle=entity.dxf.start_angle,
-                            end_angle=entity.dxf.end_angle
-                        )
-                        new_entity.dxf.layer = entity.dxf.layer
-                        entities_kept += 1
-                    
-                    elif entity_type == 'CIRCLE':
-                        new_entity = new_msp.add_circle(
-                            center=entity.dxf.center,
-                            radius=entity.dxf.radius
-                        )
-                        new_entity.dxf.layer = entity.dxf.layer
-                        entities_kept += 1
-                    
-                    elif entity_type == 'ELLIPSE':
-                        new_entity = new_msp.add_ellipse(
-                            center=entity.dxf.center,
-                            major_axis=entity.dxf.major_axis,
-                            ratio=entity.dxf.ratio,
-                            start_param=entity.dxf.start_param if hasattr(entity.dxf, 'start_param') else 0,
-                            end_param=entity.dxf.end_param if hasattr(entity.dxf, 'end_param') else 6.28318
-                        )
-                        new_entity.dxf.layer = entity.dxf.layer
-                        entities_kept += 1
-                    
-                    elif entity_type == 'SPLINE':
-                        try:
-                            # 尝试从样条曲线中获取点
-                            points = None
-                            
-                            # 首先尝试获取拟合点
-                            if hasattr(entity, 'fit_points') and entity.fit_points and len(entity.fit_points) >= 2:
-                                points = entity.fit_points
-                                log_print(f"从SPLINE获取了 {len(points)} 个拟合点", level='debug')
-                            # 如果没有拟合点，尝试获取控制点
-                            elif hasattr(entity, 'control_points') and entity.control_points and len(entity.control_points) >= 2:
-                                points = entity.control_points
-                                log_print(f"从SPLINE获取了 {len(points)} 个控制点", level='debug')
-                            
-                            # 如果有足够的点，创建LWPOLYLINE
-                            if points is not None and len(points) >= 2:
-                                # 获取二维点
-                                points_2d = [(p.x, p.y) if hasattr(p, 'x') and hasattr(p, 'y') else (p[0], p[1]) for p in points]
-                                
-                                # 检查是否是闭合曲线
-                                is_closed = False
-                                if hasattr(entity, 'is_closed'):
-                                    is_closed = entity.is_closed
-                                
-                                # 创建LWPOLYLINE
-                                new_entity = new_msp.add_lwpolyline(
-                                    points=points_2d,
-                                    dxfattribs={
-                                        'layer': entity.dxf.layer
-                                    },
-                                    close=is_closed
-                                )
-                                
-                                log_print(f"已将SPLINE转换为LWPOLYLINE，共 {len(points_2d)} 个点, 闭合状态: {is_closed}", level='debug')
-                                entities_kept += 1
-                            else:
-                                log_print(f"跳过SPLINE：未找到足够的点", level='warning')
-                        except Exception as e:
-                            log_print(f"处理SPLINE实体时出错: {e}", level='warning')
-                    
-                    elif entity_type == 'INSERT':
-                        try:
-                            # 获取源块名称
-                            block_name = entity.dxf.name
-                            
-                            # 检查目标文档中是否已存在该块定义
-                            if block_name not in new_doc.blocks:
-                                # 获取源块定义
-                                source_block = doc.blocks.get(block_name)
-                                if source_block:
-                                    # 创建新块定义
-                                    target_block = new_doc.blocks.new(block_name)
-                                    
-                                    # 复制简单实体
-                                    for block_entity in source_block:
-                                        try:
-                                            # 只处理基本实体类型
-                                            if block_entity.dxftype() in ['LINE', 'LWPOLYLINE', 'POLYLINE', 'ARC', 'CIRCLE', 'ELLIPSE']:
-                                                # 使用transform.copy_entity复制实体
-                                                copied_entity = transform.copy_entity(block_entity, target_block)
-                                                log_print(f"已复制块'{block_name}'中的实体: {block_entity.dxftype()}", level='debug')
-                                        except Exception as be:
-                                            log_print(f"复制块'{block_name}'中的实体时出错: {be}", level='warning')
-                                else:
-                                    log_print(f"未找到块定义: {block_name}", level='warning')
-                            
-                            # 创建块引用
-                            new_entity = new_msp.add_blockref(
-                                name=block_name,
-                                insert=(entity.dxf.insert.x, entity.dxf.insert.y),
-                                dxfattribs={
-                                    'layer': entity.dxf.layer
-                                }
-                            )
-                            
-                            # 设置比例和旋转
-                            if hasattr(entity.dxf, 'xscale'):
-                                new_entity.dxf.xscale = entity.dxf.xscale
-                            if hasattr(entity.dxf, 'yscale'):
-                                new_entity.dxf.yscale = entity.dxf.yscale
-                            if hasattr(entity.dxf, 'zscale'):
-                                new_entity.dxf.zscale = entity.dxf.zscale
-                            if hasattr(entity.dxf, 'rotation'):
-                                new_entity.dxf.rotation = entity.dxf.rotation
-                                
-                            log_print(f"成功处理INSERT: {block_name}", level='debug')
-                            entities_kept += 1
-                        except Exception as e:
-                            log_print(f"处理INSERT实体时出错: {e}", level='warning')
-                    
-                    elif entity_type == 'HATCH':
-                        try:
-                            boundaries_processed = False
-                            # 获取填充边界
-                            for path in entity.paths:
-                                # path可能是坐标列表或带有vertices属性的对象
-                                vertices = []
-                                if hasattr(path, 'vertices'):
-                                    # 某些版本的ezdxf，path有vertices属性
-                                    vertices = path.vertices
-                                elif isinstance(path, (list, tuple)):
-                                    # 某些版本的ezdxf，path直接是坐标列表
-                                    vertices = path
-                                
-                                # 处理顶点
-                                valid_vertices = []
-                                for vertex in vertices:
-                                    if isinstance(vertex, (list, tuple)) and len(vertex) >= 2:
-                                        valid_vertices.append((vertex[0], vertex[1]))
-                                    elif hasattr(vertex, 'x') and hasattr(vertex, 'y'):
-                                        valid_vertices.append((vertex.x, vertex.y))
-                                
-                                # 如果有足够的顶点，创建多段线边界
-                                if len(valid_vertices) >= 3:
-                                    polyline = new_msp.add_lwpolyline(valid_vertices)
-                                    polyline.dxf.layer = entity.dxf.layer
-                                    polyline.dxf.closed = True  # 填充边界通常是闭合的
-                                    boundaries_processed = True
-                            
-                            if boundaries_processed:
-                                log_print(f"HATCH转换为边界多段线成功", level='debug')
-                                entities_kept += 1
-                            else:
-                                log_print(f"未能处理HATCH边界: 没有有效的点", level='warning')
-                        except Exception as e:
-                            log_print(f"处理HATCH实体时出错: {e}", level='warning')
-                    
-                    else:
-                        log_print(f"跳过未处理的实体类型: {entity_type}")
-                
-                except Exception as e:
-                    log_print(f"手动复制实体时出错: {e}, 类型: {entity.dxftype() if hasattr(entity, 'dxftype') else '未知'}")
+            # 清除批量复制失败前可能已添加的部分实体，避免重复
+            new_msp.delete_all_entities()
+            try:
+                importer = Importer(doc, new_doc)
+                importer.import_entities(entities_to_copy, new_msp)
+                importer.finalize()
+                entities_kept = len(new_msp)
+            except Exception as ie:
+                log_print(f"使用Importer导入实体时出错: {ie}", 'error')
+                entities_kept = 0
     
     # 打印统计信息
     log_print(f"原始实体总数: {total_entities}")
@@ -1354,63 +1498,73 @@ def repair_broken_lines(doc, tolerance=0.1):
     """
     msp = doc.modelspace()
     
-    # 提取所有线段的端点
-    lines = []
-    for entity in msp.query('LINE'):
-        start = (entity.dxf.start.x, entity.dxf.start.y)
-        end = (entity.dxf.end.x, entity.dxf.end.y)
-        lines.append((start, end, entity))
-    
-    # 识别需要合并的线段
-    i = 0
-    while i < len(lines):
-        start1, end1, entity1 = lines[i]
-        merged = False
-        
-        j = i + 1
-        while j < len(lines):
-            start2, end2, entity2 = lines[j]
-            
-            # 计算各端点之间的距离
-            d_s1s2 = math.sqrt((start1[0] - start2[0])**2 + (start1[1] - start2[1])**2)
-            d_s1e2 = math.sqrt((start1[0] - end2[0])**2 + (start1[1] - end2[1])**2)
-            d_e1s2 = math.sqrt((end1[0] - start2[0])**2 + (end1[1] - start2[1])**2)
-            d_e1e2 = math.sqrt((end1[0] - end2[0])**2 + (end1[1] - end2[1])**2)
+    # 提取所有线段的端点到一个数组，每行为 (x1, y1, x2, y2)
+    entities = list(msp.query('LINE'))
+    if len(entities) < 2:
+        return doc
+    coords = np.array([(e.dxf.start.x, e.dxf.start.y, e.dxf.end.x, e.dxf.end.y) for e in entities],
+                      dtype=np.float64)
+    # 只需与容差比较，使用距离平方即可省去开方
+    tol2 = tolerance * tolerance
+    alive = np.ones(len(entities), dtype=bool)     # 尚未被合并掉的线段
+    changed = np.zeros(len(entities), dtype=bool)  # 端点已被合并改写的线段
+    
+    # 识别需要合并的线段：与逐对比较的顺序一致，第i条线依次吸收其后第一条端点足够接近的线，
+    # 但到其后所有线段的距离由NumPy一次算出，不再在Python中两两循环
+    # 最后一条线之后没有可合并的线段
+    for i in range(len(entities) - 1):
+        if not alive[i]:
+            continue
+        
+        # 其后的线段直接取连续视图，已合并掉的线段用alive掩码排除，不必每轮重新索引复制
+        other = coords[i + 1:]
+        other_alive = alive[i + 1:]
+        
+        while True:
+            x1, y1, x2, y2 = coords[i]
             
-            # 找到最小距离及对应的端点
-            min_dist = min(d_s1s2, d_s1e2, d_e1s2, d_e1e2)
+            # 计算各端点之间的距离平方: d_s 为 (s1s2, s1e2)，d_e 为 (e1s2, e1e2)
+            dx_s = x1 - other[:, 0::2]
+            dy_s = y1 - other[:, 1::2]
+            dx_e = x2 - other[:, 0::2]
+            dy_e = y2 - other[:, 1::2]
+            d_s = dx_s * dx_s + dy_s * dy_s
+            d_e = dx_e * dx_e + dy_e * dy_e
             
-            if min_dist <= tolerance:
-                # 这两条线可以合并
-                if min_dist == d_s1s2:
-                    # start1 连接 start2，需要翻转第二条线
-                    new_line = (end1, end2, None)
-                elif min_dist == d_s1e2:
-                    # start1 连接 end2
-                    new_line = (end1, start2, None)
-                elif min_dist == d_e1s2:
-                    # end1 连接 start2
-                    new_line = (start1, end2, None)
-                else:  # min_dist == d_e1e2
-                    # end1 连接 end2，需要翻转第二条线
-                    new_line = (start1, start2, None)
-                
-                # 移除原来的两条线
-                msp.delete_entity(entity1)
-                msp.delete_entity(entity2)
-                
-                # 添加合并后的新线
-                new_entity = msp.add_line(new_line[0], new_line[1])
-                lines[i] = (new_line[0], new_line[1], new_entity)
-                lines.pop(j)
-                
-                merged = True
+            near = (np.minimum(d_s, d_e).min(axis=1) <= tol2) & other_alive
+            k = near.argmax()
+            if not near[k]:
                 break
             
-            j += 1
-        
-        if not merged:
-            i += 1
+            # 这两条线可以合并，argmin在距离相同时取靠前的连接方式
+            j = i + 1 + k
+            start1, end1 = coords[i, :2].copy(), coords[i, 2:].copy()
+            start2, end2 = coords[j, :2], coords[j, 2:]
+            case = np.concatenate((d_s[k], d_e[k])).argmin()
+            if case == 0:
+                # start1 连接 start2，需要翻转第二条线
+                new_start, new_end = end1, end2
+            elif case == 1:
+                # start1 连接 end2
+                new_start, new_end = end1, start2
+            elif case == 2:
+                # end1 连接 start2
+                new_start, new_end = start1, end2
+            else:
+                # end1 连接 end2，需要翻转第二条线
+                new_start, new_end = start1, start2
+            
+            coords[i, :2] = new_start
+            coords[i, 2:] = new_end
+            changed[i] = True
+            alive[j] = False
+    
+    # 分析完成后一次性修改文档：移除被合并的原线段，添加合并后的新线
+    for idx in np.flatnonzero(changed | ~alive):
+        msp.delete_entity(entities[idx])
+    for idx in np.flatnonzero(changed & alive):
+        x1, y1, x2, y2 = coords[idx]
+        msp.add_line((x1, y1), (x2, y2))
     
     return doc
 
@@ -1424,7 +1578,7 @@ def extract_walls_and_rooms(doc, min_room_area, img_size=2000):
         img_size: 图像大小
     
     返回:
-        walls: 墙体线条列表
+        walls: 墙体线段 (starts, ends, wall_ids)，起点/终点为 (N, 2) float64 数组，wall_ids为每条线段所属墙体的编号
         rooms: 识别出的房间列表
         extents: 图纸范围 [xmin, ymin, xmax, ymax]
     """
@@ -1437,30 +1591,8 @@ def extract_walls_and_rooms(doc, min_room_area, img_size=2000):
     layers_info = analyze_layers(doc)
     
     # 识别墙体图层和房间图层
-    keep_layers = identify_wall_layers(layers_info)
-    
-    # 从墙体图层函数的返回中获取房间图层信息
-    # 临时提取房间图层列表，不影响原有代码逻辑
-    room_layers = []
-    for layer_name, info in layers_info.items():
-        # 使用与identify_wall_layers中相同的is_room_layer判断逻辑
-        # 判断是否为房间图层
-        if any(keyword in layer_name.lower() for keyword in ['room', 'room', '房间', '房', 'space', 'space', '空间', 
-                                                           'area', 'area', '区域', 'arch-room', 'a-room', 'a-zone']):
-            room_layers.append(layer_name)
-            continue
-            
-        # 基于实体类型判断
-        entity_types = info['entity_types']
-        if ('LWPOLYLINE' in entity_types or 'POLYLINE' in entity_types or 'HATCH' in entity_types) and \
-           not info['is_frozen']:
-            # 额外判断
-            line_count = entity_types.get('LINE', 0)
-            polyline_count = entity_types.get('LWPOLYLINE', 0) + entity_types.get('POLYLINE', 0)
-            hatch_count = entity_types.get('HATCH', 0)
-            
-            if (polyline_count > 5 or hatch_count > 0) and (line_count == 0 or polyline_count / line_count > 0.5):
-                room_layers.append(layer_name)
+    # 房间图层直接使用identify_wall_layers的识别结果，不再重复判断
+    _, room_layers = identify_wall_layers(layers_info)
     
     # 1. 先尝试从专门的房间图层提取房间
     rooms_from_layers = []
@@ -1470,45 +1602,50 @@ def extract_walls_and_rooms(doc, min_room_area, img_size=2000):
         log_print("尝试从专门的房间图层直接提取房间...")
         
         # 提取多段线实体，这些通常定义了房间边界
-        for entity in msp.query('LWPOLYLINE POLYLINE HATCH'):
+        # 类型和图层在同一次模型空间遍历中筛选，不先生成整个类型查询结果再逐个过滤；
+        # 实体类型只取一次，后续分支直接比较
+        for entity in msp:
+            etype = entity.dxftype()
+            if etype not in ('LWPOLYLINE', 'POLYLINE', 'HATCH') or entity.dxf.layer not in room_layers:
+                continue
             try:
-                if hasattr(entity, 'dxf') and hasattr(entity.dxf, 'layer') and entity.dxf.layer in room_layers:
-                    if entity.dxftype() == 'LWPOLYLINE':
-                        # 检查多段线是否闭合
+                if etype == 'LWPOLYLINE':
+                    # 检查多段线是否闭合
+                    if entity.is_closed:
+                        points = entity.get_points('xy')
+                        if len(points) >= 3 and is_valid_room(points, min_room_area):
+                            rooms_from_layers.append(points)
+                
+                elif etype == 'POLYLINE':
+                    try:
                         if entity.is_closed:
-                            points = [(point[0], point[1]) for point in entity.get_points()]
+                            vertices = entity.vertices
+                            if callable(vertices):
+                                vertices = vertices()
+                            
+                            points = []
+                            if hasattr(vertices, '__iter__'):
+                                # 每个顶点的location只读取一次
+                                locations = [vertex.dxf.location for vertex in vertices
+                                             if hasattr(vertex, 'dxf') and hasattr(vertex.dxf, 'location')]
+                                points = [(loc[0], loc[1]) for loc in locations]
+                            
                             if len(points) >= 3 and is_valid_room(points, min_room_area):
                                 rooms_from_layers.append(points)
-                    
-                    elif entity.dxftype() == 'POLYLINE':
-                        try:
-                            if entity.is_closed:
-                                vertices = entity.vertices
-                                if callable(vertices):
-                                    vertices = vertices()
-                                
-                                points = []
-                                if hasattr(vertices, '__iter__'):
-                                    for vertex in vertices:
-                                        if hasattr(vertex, 'dxf') and hasattr(vertex.dxf, 'location'):
-                                            points.append((vertex.dxf.location[0], vertex.dxf.location[1]))
-                                
-                                if len(points) >= 3 and is_valid_room(points, min_room_area):
+                    except Exception as e:
+                        log_print(f"警告: 处理房间图层POLYLINE时出错: {e}")
+                
+                # 处理填充区域（有时用于表示房间）
+                elif etype == 'HATCH':
+                    try:
+                        for path in entity.paths:
+                            if path.is_polyline_path and len(path.vertices) >= 3:
+                                # 将填充区域边界作为房间
+                                points = [(vertex[0], vertex[1]) for vertex in path.vertices]
+                                if is_valid_room(points, min_room_area):
                                     rooms_from_layers.append(points)
-                        except Exception as e:
-                            log_print(f"警告: 处理房间图层POLYLINE时出错: {e}")
-                    
-                    # 处理填充区域（有时用于表示房间）
-                    elif entity.dxftype() == 'HATCH':
-                        try:
-                            for path in entity.paths:
-                                if path.is_polyline_path and len(path.vertices) >= 3:
-                                    # 将填充区域边界作为房间
-                                    points = [(vertex[0], vertex[1]) for vertex in path.vertices]
-                                    if is_valid_room(points, min_room_area):
-                                        rooms_from_layers.append(points)
-                        except Exception as e:
-                            log_print(f"警告: 处理房间图层HATCH时出错: {e}")
+                    except Exception as e:
+                        log_print(f"警告: 处理房间图层HATCH时出错: {e}")
             except Exception as e:
                 log_print(f"警告: 处理房间图层实体时出错: {e}")
         
@@ -1530,45 +1667,40 @@ def extract_walls_and_rooms(doc, min_room_area, img_size=2000):
                 extents_from_rooms = (min_x, min_y, max_x, max_y)
     
     # 2. 收集所有线条和多段线（用于墙体识别）
-    walls = []
-    exclude_layers = set()
-    # 排除家具、设备、标注等非墙体图层
-    furniture_equipment_keywords = ['家具', 'FURN', 'furniture', '设备', 'EQUIP', 'equipment', 
-                                   '标注', 'TEXT', 'text', 'ANNO', 'annotation', '轴网', 
-                                   'GRID', 'grid', '灯具', 'LIGHT', '卫生', 'TOILET', 
-                                   'PLUMB', '管道', 'PIPE', '电气', 'ELEC']
-    
-    # 创建排除图层集合
-    for layer_name in layers_info.keys():
-        if any(keyword in layer_name for keyword in furniture_equipment_keywords):
-            exclude_layers.add(layer_name)
+    # 线段按结构数组(SoA)收集：起点、终点和所属墙体编号分别放在各自的列表中，最后一次性转为数组
+    starts, ends, wall_ids = [], [], []
+    wall_count = 0
+    # 排除家具、设备、标注等非墙体图层，每个图层名只做一次正则扫描
+    exclude_layers = {layer_name for layer_name in layers_info if _FURNITURE_RE.search(layer_name)}
     
     log_print(f"排除的非墙体图层: {len(exclude_layers)} 个")
     
-    for entity in msp.query('LINE LWPOLYLINE POLYLINE'):
+    # 遍历时直接跳过排除图层上的实体，实体类型只取一次
+    for entity in msp:
+        etype = entity.dxftype()
+        if etype not in ('LINE', 'LWPOLYLINE', 'POLYLINE') or entity.dxf.layer in exclude_layers:
+            continue
         try:
-            # 跳过来自排除图层的实体
-            if hasattr(entity, 'dxf') and hasattr(entity.dxf, 'layer') and entity.dxf.layer in exclude_layers:
-                continue
-                
             # 处理不同类型的实体
-            if entity.dxftype() == 'LINE':
-                start = (entity.dxf.start.x, entity.dxf.start.y)
-                end = (entity.dxf.end.x, entity.dxf.end.y)
-                walls.append([(start, end)])
+            if etype == 'LINE':
+                starts.append((entity.dxf.start.x, entity.dxf.start.y))
+                ends.append((entity.dxf.end.x, entity.dxf.end.y))
+                wall_ids.append(wall_count)
+                wall_count += 1
             
-            elif entity.dxftype() == 'LWPOLYLINE':
-                points = [(point[0], point[1]) for point in entity.get_points()]
+            elif etype == 'LWPOLYLINE':
+                points = entity.get_points('xy')
                 if len(points) >= 2:
-                    segments = []
-                    for i in range(len(points) - 1):
-                        segments.append((points[i], points[i+1]))
-                    # 如果是闭合的多段线，连接最后一点和第一点
+                    # 相邻顶点构成线段；如果是闭合的多段线，连接最后一点和第一点
+                    starts.extend(points[:-1])
+                    ends.extend(points[1:])
                     if entity.is_closed:
-                        segments.append((points[-1], points[0]))
-                    walls.append(segments)
+                        starts.append(points[-1])
+                        ends.append(points[0])
+                    wall_ids.extend([wall_count] * (len(starts) - len(wall_ids)))
+                    wall_count += 1
             
-            elif entity.dxftype() == 'POLYLINE':
+            elif etype == 'POLYLINE':
                 try:
                     vertices = entity.vertices
                     if callable(vertices):
@@ -1576,25 +1708,31 @@ def extract_walls_and_rooms(doc, min_room_area, img_size=2000):
                     
                     points = []
                     if hasattr(vertices, '__iter__'):
-                        for vertex in vertices:
-                            if hasattr(vertex, 'dxf') and hasattr(vertex.dxf, 'location'):
-                                points.append((vertex.dxf.location[0], vertex.dxf.location[1]))
+                        # 每个顶点的location只读取一次
+                        locations = [vertex.dxf.location for vertex in vertices
+                                     if hasattr(vertex, 'dxf') and hasattr(vertex.dxf, 'location')]
+                        points = [(loc[0], loc[1]) for loc in locations]
                     
                     if len(points) >= 2:
-                        segments = []
-                        for i in range(len(points) - 1):
-                            segments.append((points[i], points[i+1]))
-                        # 如果是闭合的多段线，连接最后一点和第一点
+                        # 相邻顶点构成线段；如果是闭合的多段线，连接最后一点和第一点
+                        starts.extend(points[:-1])
+                        ends.extend(points[1:])
                         if entity.is_closed:
-                            segments.append((points[-1], points[0]))
-                        walls.append(segments)
+                            starts.append(points[-1])
+                            ends.append(points[0])
+                        wall_ids.extend([wall_count] * (len(starts) - len(wall_ids)))
+                        wall_count += 1
                 except Exception as e:
                     log_print(f"警告: 处理POLYLINE时出错: {e}")
         
         except Exception as e:
             log_print(f"警告: 处理实体时出错: {e}")
     
-    log_print(f"收集到 {len(walls)} 条墙体线/多段线")
+    walls = (np.asarray(starts, dtype=np.float64).reshape(-1, 2),
+             np.asarray(ends, dtype=np.float64).reshape(-1, 2),
+             np.asarray(wall_ids, dtype=np.int32))
+    
+    log_print(f"收集到 {wall_count} 条墙体线/多段线")
     
     # 3. 将墙体线条转换为栅格图像
     walls_img, extents_from_walls = convert_walls_to_image(walls, img_size)
@@ -1628,7 +1766,7 @@ def extract_walls_and_rooms(doc, min_room_area, img_size=2000):
     
     log_print(f"最终识别出 {len(all_rooms)} 个房间")
     
-    # Return the original walls list, rooms list, and the calculated extents
+    # Return the wall segment arrays, rooms list, and the calculated extents
     return walls, all_rooms, final_extents
 
 def convert_walls_to_image(walls, img_size=2000, line_thickness=5):
@@ -1636,45 +1774,44 @@ def convert_walls_to_image(walls, img_size=2000, line_thickness=5):
     将墙体线条转换为二值图像
     
     参数:
-        walls: 墙体线条列表
+        walls: 墙体线段 (starts, ends, wall_ids)，见extract_walls_and_rooms
         img_size: 图像大小
         line_thickness: 墙体线条粗细
     
     返回:
-        img: 墙体二值图像
+        img: 墙体二值图像 (当前线程复用的缓冲区，下次调用时会被覆盖)
         extents: 图像范围 (min_x, min_y, max_x, max_y)
     """
-    # 计算所有线条的边界范围
-    min_x, min_y = float('inf'), float('inf')
-    max_x, max_y = float('-inf'), float('-inf')
-    
-    for wall in walls:
-        for segment in wall:
-            start, end = segment
-            min_x = min(min_x, start[0], end[0])
-            min_y = min(min_y, start[1], end[1])
-            max_x = max(max_x, start[0], end[0])
-            max_y = max(max_y, start[1], end[1])
-    
-    # 创建空白图像
-    img = np.zeros((img_size, img_size), dtype=np.uint8)
-    
-    # 绘制墙体线条
-    for wall in walls:
-        for segment in wall:
-            start, end = segment
-            # 转换坐标到图像空间
-            start_x = int((start[0] - min_x) / (max_x - min_x + 1e-10) * (img_size - 1))
-            start_y = int((start[1] - min_y) / (max_y - min_y + 1e-10) * (img_size - 1))
-            end_x = int((end[0] - min_x) / (max_x - min_x + 1e-10) * (img_size - 1))
-            end_y = int((end[1] - min_y) / (max_y - min_y + 1e-10) * (img_size - 1))
-            
-            # 绘制线条
-            cv2.line(img, (start_x, start_y), (end_x, end_y), 255, line_thickness)
+    starts, ends, _ = walls
+    # 组合为 (M, 2, 2) 线段数组，一次性计算边界范围
+    segments = np.stack([starts, ends], axis=1)
+    
+    if len(segments):
+        min_x, min_y = (float(v) for v in np.minimum(starts, ends).min(axis=0))
+        max_x, max_y = (float(v) for v in np.maximum(starts, ends).max(axis=0))
+    else:
+        min_x, min_y = float('inf'), float('inf')
+        max_x, max_y = float('-inf'), float('-inf')
+    
+    # 复用空白图像缓冲区，清零后绘制
+    img = get_buffer('walls', (img_size, img_size))
+    img.fill(0)
+    
+    if len(segments):
+        # 一次性把所有线段端点转换到图像空间 (坐标非负，astype截断与int()一致)
+        origin = np.array([min_x, min_y])
+        span = np.array([max_x - min_x, max_y - min_y]) + 1e-10
+        pixels = ((segments - origin) / span * (img_size - 1)).astype(np.int32)
+        
+        # 每条线段作为一条两点折线，一次调用绘制全部线条
+        cv2.polylines(img, list(pixels), False, 255, line_thickness)
     
     extents = (min_x, min_y, max_x, max_y)
     return img, extents
 
+# 房间识别中闭运算使用的3x3矩形结构元素，模块加载时创建一次
+_CLOSE_K3 = cv2.getStructuringElement(cv2.MORPH_RECT, (3, 3))
+
 def identify_rooms(img, extents, min_room_area=1.0, max_room_area=None):
     """
     从墙体图像中识别闭合区域（可能的房间）
@@ -1686,8 +1823,11 @@ def identify_rooms(img, extents, min_room_area=1.0, max_room_area=None):
         max_room_area: 最大房间面积，占图纸总面积的百分比(%)，如果为None则默认为60%
     
     返回:
-        rooms: 房间多边形列表，每个多边形是一个顶点列表[(x1,y1), (x2,y2), ...]
+        rooms: 房间多边形列表，每个多边形是一个 (N, 2) 顶点数组
     """
+    # skimage导入较慢，只在需要识别房间时才导入
+    from skimage import measure
+    
     min_x, min_y, max_x, max_y = extents
     img_size = img.shape[0]
     
@@ -1710,109 +1850,112 @@ def identify_rooms(img, extents, min_room_area=1.0, max_room_area=None):
     log_print(f"对应实际面积比例: {min_room_area}% - {max_room_area if max_room_area else 60}% 的图纸总面积")
     
     # 保存中间结果，用于诊断
-    try:
-        debug_dir = os.path.join(os.getcwd(), 'debug')
-        if not os.path.exists(debug_dir):
-            os.makedirs(debug_dir)
-        save_image(img, os.path.join(debug_dir, 'walls_binary.png'), title="墙体二值图")
-    except Exception as e:
-        log_print(f"保存调试图像时出错: {e}")
+    debug_dir = os.path.join(os.getcwd(), 'debug')
+    if _DEBUG:
+        try:
+            os.makedirs(debug_dir, exist_ok=True)
+            save_image(img, os.path.join(debug_dir, 'walls_binary.png'), title="墙体二值图")
+        except Exception as e:
+            log_print(f"保存调试图像时出错: {e}")
     
-    # 反转图像，使墙体为0（黑），空间为1（白）
-    # 首先生成全1图像
-    filled_img = np.ones_like(img)
-    # 将墙体部分设为0
-    filled_img[img > 0] = 0
+    # 反转图像，使墙体为0（黑），空间为1（白），一次阈值操作完成
+    filled_img = cv2.threshold(img, 0, 1, cv2.THRESH_BINARY_INV, dst=get_buffer('rooms_inverted', img.shape))[1]
     
     # 保存中间结果，用于诊断
-    try:
-        save_image(filled_img * 255, os.path.join(debug_dir, 'inverted_walls.png'), title="反转墙体图")
-    except Exception as e:
-        log_print(f"保存调试图像时出错: {e}")
+    if _DEBUG:
+        try:
+            save_image(filled_img * 255, os.path.join(debug_dir, 'inverted_walls.png'), title="反转墙体图")
+        except Exception as e:
+            log_print(f"保存调试图像时出错: {e}")
     
     # 增加形态学操作，填充小的缝隙和孔洞
-    kernel = np.ones((3, 3), np.uint8)
-    filled_img = cv2.morphologyEx(filled_img, cv2.MORPH_CLOSE, kernel)
+    # 3x3结构元素下边界复制与默认边界结果相同，但可以走OpenCV的快速路径
+    filled_img = cv2.morphologyEx(filled_img, cv2.MORPH_CLOSE, _CLOSE_K3, dst=get_buffer('rooms_closed', img.shape),
+                                  borderType=cv2.BORDER_REPLICATE)
     
     # 保存中间结果，用于诊断
-    try:
-        save_image(filled_img * 255, os.path.join(debug_dir, 'filled_gaps.png'), title="填充缝隙后的图像")
-    except Exception as e:
-        log_print(f"保存调试图像时出错: {e}")
-    
-    # 标记连通区域
-    labeled_img = measure.label(filled_img, connectivity=2)
-    props = measure.regionprops(labeled_img)
+    if _DEBUG:
+        try:
+            save_image(filled_img * 255, os.path.join(debug_dir, 'filled_gaps.png'), title="填充缝隙后的图像")
+        except Exception as e:
+            log_print(f"保存调试图像时出错: {e}")
+    
+    # 标记连通区域(8连通)，同时得到每个区域的面积和包围盒；第0行是背景(墙体)，跳过
+    num_labels, labeled_img, stats, _ = cv2.connectedComponentsWithStats(
+        filled_img, labels=get_buffer('rooms_labels', img.shape, np.int32), connectivity=8, ltype=cv2.CV_32S)
+    labels = np.arange(1, num_labels)
+    areas = stats[1:, cv2.CC_STAT_AREA]
+    # 包围盒转换为 (min_row, min_col, max_row, max_col)，与regionprops的bbox约定一致
+    top = stats[1:, cv2.CC_STAT_TOP]
+    left = stats[1:, cv2.CC_STAT_LEFT]
+    bboxes = np.stack([top, left, top + stats[1:, cv2.CC_STAT_HEIGHT], left + stats[1:, cv2.CC_STAT_WIDTH]], axis=1)
     
     # 保存标记图像，用于诊断
-    try:
-        # 归一化标记图像以便显示
-        label_viz = np.zeros_like(labeled_img, dtype=np.uint8)
-        for i, prop in enumerate(props):
-            label_viz[labeled_img == prop.label] = (i % 254) + 1
-        save_image(label_viz, os.path.join(debug_dir, 'labeled_regions.png'), title="标记的连通区域")
-    except Exception as e:
-        log_print(f"保存调试图像时出错: {e}")
-    
-    # 获取边缘区域的标签
-    edge_labels = set()
-    for x in range(img_size):
-        if labeled_img[0, x] > 0:
-            edge_labels.add(labeled_img[0, x])
-        if labeled_img[img_size-1, x] > 0:
-            edge_labels.add(labeled_img[img_size-1, x])
-    for y in range(img_size):
-        if labeled_img[y, 0] > 0:
-            edge_labels.add(labeled_img[y, 0])
-        if labeled_img[y, img_size-1] > 0:
-            edge_labels.add(labeled_img[y, img_size-1])
-    
-    # 筛选可能的房间
+    if _DEBUG:
+        try:
+            # 归一化标记图像以便显示：先建立 标签->显示值 的查找表，再一次索引整幅图像
+            viz_lut = np.zeros(num_labels, dtype=np.uint8)
+            viz_lut[labels] = np.arange(len(labels)) % 254 + 1
+            label_viz = viz_lut[labeled_img]
+            save_image(label_viz, os.path.join(debug_dir, 'labeled_regions.png'), title="标记的连通区域")
+        except Exception as e:
+            log_print(f"保存调试图像时出错: {e}")
+    
+    # 获取边缘区域的标签：取图像四条边上的像素，建立按标签索引的查找表
+    border = np.concatenate([labeled_img[0], labeled_img[-1], labeled_img[:, 0], labeled_img[:, -1]])
+    # 标签总数直接取自连通区域标记结果，不必再扫描整幅图像求最大值；重复标签直接赋值即可，无需去重排序
+    is_edge = np.zeros(num_labels, dtype=bool)
+    is_edge[border] = True
+    is_edge[0] = False
+    
+    # 筛选可能的房间，前三个过滤条件对所有区域一次性按列计算
     rooms = []
-    filtered_count = 0
-    edge_filtered = 0
-    area_filtered = 0
-    shape_filtered = 0
-    
-    for prop in props:
-        area = prop.area
-        label = prop.label
-        
-        # 过滤条件1: 检查面积是否在要求的范围内
-        if area < min_room_area_pixels:
-            area_filtered += 1
-            continue
-        if max_room_area_pixels is not None and area > max_room_area_pixels:
-            area_filtered += 1
-            continue
-        
-        # 过滤条件2: 排除接触图像边缘的区域（通常是外部空间而非房间）
-        if label in edge_labels:
-            edge_filtered += 1
-            continue
-        
-        # 过滤条件3: 检查形状
-        # 计算紧凑度 (4π*面积/周长²)，接近1表示圆形，接近0表示复杂形状
-        perimeter = prop.perimeter
-        if perimeter > 0:
-            compactness = 4 * np.pi * area / (perimeter * perimeter)
-            # 降低形状限制，允许更多形状
-            if compactness < 0.03:  # 原来是0.05，现在放宽到0.03
-                shape_filtered += 1
-                continue
-        
-        # 获取区域边界
-        contours = measure.find_contours(labeled_img == label, 0.5)
+    
+    # 过滤条件1: 检查面积是否在要求的范围内
+    area_bad = areas < min_room_area_pixels
+    if max_room_area_pixels is not None:
+        area_bad |= areas > max_room_area_pixels
+    
+    # 过滤条件2: 排除接触图像边缘的区域（通常是外部空间而非房间）
+    edge_bad = ~area_bad & is_edge[labels]
+    
+    # 过滤条件3: 检查形状
+    # 周长计算较慢，只对通过前两个条件的区域在其包围盒内计算 (与regionprops的perimeter一致)
+    perimeters = np.zeros(len(labels))
+    for i in np.flatnonzero(~area_bad & ~edge_bad):
+        r0, c0, r1, c1 = bboxes[i]
+        perimeters[i] = measure.perimeter(labeled_img[r0:r1, c0:c1] == labels[i], 4)
+    # 计算紧凑度 (4π*面积/周长²)，接近1表示圆形，接近0表示复杂形状；周长为0时不做形状过滤
+    with np.errstate(divide='ignore', invalid='ignore'):
+        compactness = 4 * np.pi * areas / (perimeters * perimeters)
+    # 降低形状限制，允许更多形状
+    shape_bad = ~area_bad & ~edge_bad & (perimeters > 0) & (compactness < 0.03)  # 原来是0.05，现在放宽到0.03
+    
+    area_filtered = int(area_bad.sum())
+    edge_filtered = int(edge_bad.sum())
+    shape_filtered = int(shape_bad.sum())
+    
+    keep = np.flatnonzero(~(area_bad | edge_bad | shape_bad))
+    # OpenCV的区域编号不是逐行扫描顺序，按区域第一个像素的位置(先行后列)排序，保持房间输出顺序不变
+    first_pixels = []
+    for i in keep:
+        top, left, _, right = bboxes[i]
+        first_pixels.append((top, left + np.argmax(labeled_img[top, left:right] == labels[i])))
+    keep = keep[sorted(range(len(keep)), key=first_pixels.__getitem__)]
+    for label, area, (r0, c0, r1, c1) in zip(labels[keep], areas[keep], bboxes[keep]):
+        # 获取区域边界：只在包围盒内用OpenCV提取外轮廓，避免每个区域都扫描整幅图像
+        # 轮廓点是边界像素的整数坐标，后面还要做多边形简化，亚像素精度没有意义
+        region_mask = (labeled_img[r0:r1, c0:c1] == label).astype(np.uint8)
+        contours, _ = cv2.findContours(region_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
         if contours:
-            # 选择最长的轮廓
-            longest_contour = max(contours, key=len)
+            # 选择最长的轮廓，并平移回整幅图像的像素坐标 (x为列, y为行)
+            longest_contour = max(contours, key=len).reshape(-1, 2) + (c0, r0)
             
-            # 将轮廓点转换回原始坐标系
-            room_poly = []
-            for y, x in longest_contour:
-                orig_x = min_x + (x / (img_size - 1)) * (max_x - min_x)
-                orig_y = min_y + (y / (img_size - 1)) * (max_y - min_y)
-                room_poly.append((orig_x, orig_y))
+            # 将轮廓点一次性转换回原始坐标系，得到 (N, 2) 数组
+            room_poly = np.column_stack([
+                min_x + (longest_contour[:, 0] / (img_size - 1)) * (max_x - min_x),
+                min_y + (longest_contour[:, 1] / (img_size - 1)) * (max_y - min_y),
+            ])
             
             # 简化多边形，根据区域大小调整简化容差
             tolerance = 1.0
@@ -1843,26 +1986,21 @@ def simplify_polygon(points, tolerance=1.0):
     简化多边形，减少顶点数
     
     参数:
-        points: 多边形顶点列表
+        points: 多边形顶点，(N, 2) numpy数组或顶点列表
         tolerance: 简化容差
     
     返回:
-        简化后的多边形顶点列表
+        简化后的多边形顶点，(M, 2) float32 numpy数组
     """
-    # 转换为numpy数组，便于处理
-    points_np = np.array(points)
-    
     # 转换为OpenCV格式的轮廓
-    contour = np.expand_dims(points_np.astype(np.float32), 1)
+    contour = np.asarray(points, dtype=np.float32).reshape(-1, 1, 2)
     
     # 使用Douglas-Peucker算法简化多边形
     epsilon = tolerance
     simplified = cv2.approxPolyDP(contour, epsilon, True)
     
-    # 转换回原始格式
-    simplified_points = [(p[0][0], p[0][1]) for p in simplified]
-    
-    return simplified_points
+    # 去掉OpenCV轮廓的中间维度，直接返回数组
+    return simplified.reshape(-1, 2)
 
 def save_rooms_to_dxf(rooms, output_file):
     """
@@ -1890,7 +2028,7 @@ def save_rooms_to_dxf(rooms, output_file):
         if rooms:
             for i, room in enumerate(rooms):
                 try:
-                    if not room or len(room) < 3:
+                    if room is None or len(room) < 3:
                         continue
                     polyline = msp.add_lwpolyline(room)
                     polyline.dxf.layer = 'ROOMS'
@@ -1916,7 +2054,7 @@ def create_rooms_overview(walls, rooms, extents, output_file, img_size=2000, tit
     创建房间总览图，包含墙体和房间信息
     
     参数:
-        walls: 墙体线条列表
+        walls: 墙体线段 (starts, ends, wall_ids)，见extract_walls_and_rooms
         rooms: 房间多边形列表
         extents: 图纸范围 (min_x, min_y, max_x, max_y)
         output_file: 输出文件路径
@@ -1929,11 +2067,12 @@ def create_rooms_overview(walls, rooms, extents, output_file, img_size=2000, tit
     log_print(f"生成房间总览图像: {output_file}")
     
     try:
-        # 创建空白RGB图像
-        img = np.ones((img_size, img_size, 3), dtype=np.uint8) * 255
+        # 复用RGB图像缓冲区，填充为白色背景
+        img = get_buffer('overview', (img_size, img_size, 3))
+        img.fill(255)
         
         # 检查数据是否为空
-        if not walls and not rooms:
+        if (walls is None or len(walls[0]) == 0) and not rooms:
             log_print("警告: 没有墙体和房间数据，无法生成总览图", 'warning')
             # 创建一个包含错误消息的图像
             text = "未检测到有效的墙体和房间数据"
@@ -1967,18 +2106,12 @@ def create_rooms_overview(walls, rooms, extents, output_file, img_size=2000, tit
         offset_x = (img_size - width * scale) / 2
         offset_y = (img_size - height * scale) / 2
         
-        # 坐标转换函数，将原始坐标转换为图像坐标
-        def transform(point):
-            try:
-                x = int(offset_x + (point[0] - min_x) * scale)
-                y = int(img_size - (offset_y + (point[1] - min_y) * scale))  # Y坐标反转
-                # 确保坐标在图像范围内
-                x = max(0, min(x, img_size - 1))
-                y = max(0, min(y, img_size - 1))
-                return (x, y)
-            except Exception as e:
-                log_print(f"坐标转换出错: {e}, 点: {point}")
-                return (0, 0)  # 返回安全值
+        # 坐标转换函数，将 (N, 2) 原始坐标数组一次性转换为图像坐标
+        def transform_array(arr):
+            x = offset_x + (arr[:, 0] - min_x) * scale
+            y = img_size - (offset_y + (arr[:, 1] - min_y) * scale)  # Y坐标反转
+            # 确保坐标在图像范围内 (先截断再取整，与逐点int()后截断结果相同)
+            return np.stack([np.clip(x, 0, img_size - 1), np.clip(y, 0, img_size - 1)], axis=1).astype(np.int32)
         
         # 使用不同颜色填充房间
         colors = [
@@ -1999,25 +2132,27 @@ def create_rooms_overview(walls, rooms, extents, output_file, img_size=2000, tit
         if rooms:
             for i, room in enumerate(rooms):
                 try:
-                    if not room or len(room) < 3:
+                    if room is None or len(room) < 3:
                         continue
                     
                     # 准备房间多边形
-                    points = np.array([transform(point) for point in room], dtype=np.int32)
+                    room_pts = np.asarray(room, dtype=np.float64)
+                    points = transform_array(room_pts)
                     
-                    # 填充房间（半透明颜色）
+                    # 填充房间（半透明颜色），只复制并混合房间包围盒内的区域，结果直接写回原图
                     color = colors[i % len(colors)]
-                    overlay = img.copy()
-                    cv2.fillPoly(overlay, [points], color)
-                    cv2.addWeighted(overlay, 0.3, img, 0.7, 0, img)  # 设置透明度
+                    x0, y0, w, h = cv2.boundingRect(points)
+                    roi = img[y0:y0 + h, x0:x0 + w]
+                    overlay = roi.copy()
+                    cv2.fillPoly(overlay, [points], color, offset=(-x0, -y0))
+                    cv2.addWeighted(overlay, 0.3, roi, 0.7, 0, roi)  # 设置透明度
                     
                     # 绘制房间边界
                     cv2.polylines(img, [points], True, color, 2)
                     
                     # 添加房间编号
-                    centroid_x = sum(point[0] for point in room) / len(room)
-                    centroid_y = sum(point[1] for point in room) / len(room)
-                    center = transform((centroid_x, centroid_y))
+                    center_x, center_y = transform_array(room_pts.mean(axis=0, keepdims=True))[0]
+                    center = (int(center_x), int(center_y))
                     cv2.putText(img, f"{i+1}", center, cv2.FONT_HERSHEY_SIMPLEX, 
                                1.5, (0, 0, 0), 3, cv2.LINE_AA)
                     
@@ -2094,33 +2229,23 @@ def save_room_to_dxf(room, output_file):
         doc.layers.add(name='ROOM', color=2)  # 黄色
         
         # 添加房间多边形
-        if room and len(room) >= 3:
+        if room is not None and len(room) >= 3:
             polyline = msp.add_lwpolyline(room)
             polyline.dxf.layer = 'ROOM'
             polyline.closed = True
             
             # 添加房间中心点
-            centroid_x = sum(point[0] for point in room) / len(room)
-            centroid_y = sum(point[1] for point in room) / len(room)
+            pts = np.asarray(room, dtype=np.float64)[:, :2]
+            centroid_x, centroid_y = (float(v) for v in pts.mean(axis=0))
             
             # 在中心点添加标记
             center_point = msp.add_circle((centroid_x, centroid_y), radius=0.5)
             center_point.dxf.layer = 'ROOM'
             
-            # 计算房间面积和周长
-            area = 0
-            perimeter = 0
-            for i in range(len(room)):
-                j = (i + 1) % len(room)
-                area += room[i][0] * room[j][1]
-                area -= room[j][0] * room[i][1]
-                
-                # 计算两点之间的距离
-                dx = room[j][0] - room[i][0]
-                dy = room[j][1] - room[i][1]
-                perimeter += math.sqrt(dx*dx + dy*dy)
-            
-            area = abs(area) / 2
+            # 计算房间面积(鞋带公式)和周长，nxt为每个顶点的下一个顶点(首尾相连)
+            nxt = np.roll(pts, -1, axis=0)
+            area = abs(np.sum(pts[:, 0] * nxt[:, 1] - nxt[:, 0] * pts[:, 1])) / 2
+            perimeter = np.hypot(nxt[:, 0] - pts[:, 0], nxt[:, 1] - pts[:, 1]).sum()
             
             # 添加面积和周长文本
             text = msp.add_text(f"面积: {area:.2f}平方单位\n周长: {perimeter:.2f}单位")
@@ -2136,12 +2261,93 @@ def save_room_to_dxf(room, output_file):
         log_print(f"保存房间到DXF文件时出错: {e}")
         return False
 
+def get_save_canvas():
+    """
+    获取save_image复用的matplotlib画布
+    
+    画布只创建一次，之后每次保存只替换图像数据 (im.set_data)，
+    不再重复分配Figure、重建坐标轴。Figure不经过pyplot创建，因此不会被plt.close('all')关闭。
+    第一次创建画布时才导入matplotlib并配置中文字体。
+    
+    返回:
+        (fig, ax, im) 元组
+    """
+    global _save_canvas
+    
+    if _save_canvas is None:
+        from matplotlib.figure import Figure
+        
+        # 设置matplotlib支持中文
+        setup_matplotlib_chinese()
+        
+        fig = Figure(figsize=(10, 10))
+        ax = fig.add_subplot(111)
+        im = ax.imshow(np.zeros((2, 2), dtype=np.uint8), cmap='gray')
+        ax.axis('off')  # 不显示坐标轴
+        fig.tight_layout()  # 调整布局
+        _save_canvas = (fig, ax, im)
+    
+    return _save_canvas
+
+@functools.lru_cache(maxsize=None)
+def load_title_font(font_size=36):
+    """
+    加载PIL绘制中文标题用的字体，每个字号只查找一次字体文件
+    
+    参数:
+        font_size: 字号
+    
+    返回:
+        PIL字体对象，找不到系统中文字体时返回PIL默认字体
+    """
+    from PIL import ImageFont
+    
+    # 优先尝试Windows系统字体
+    windows_font_paths = [
+        r"C:\Windows\Fonts\simhei.ttf",  # 黑体
+        r"C:\Windows\Fonts\msyh.ttc",    # 微软雅黑
+        r"C:\Windows\Fonts\simsun.ttc",  # 宋体
+    ]
+    
+    for font_path in windows_font_paths:
+        if os.path.exists(font_path):
+            try:
+                # log_print(f"使用PIL字体: {font_path}")
+                return ImageFont.truetype(font_path, font_size)
+            except:
+                continue
+    
+    # 如果没有找到系统字体，使用默认字体
+    # log_print("使用PIL默认字体")
+    return ImageFont.load_default()
+
+def write_png(img, output_file):
+    """
+    用OpenCV编码PNG，再通过numpy写出文件
+    (Windows下cv2.imwrite无法打开含中文等非ASCII字符的路径)
+    
+    参数:
+        img: 要保存的图像 (numpy数组，彩色图像为BGR顺序)
+        output_file: 输出文件路径
+    
+    返回:
+        成功返回True，失败返回False
+    """
+    ok, buf = cv2.imencode('.png', img, [cv2.IMWRITE_PNG_COMPRESSION, PNG_COMPRESSION_LEVEL])
+    if not ok:
+        return False
+    buf.tofile(output_file)
+    return True
+
 def save_image(img, output_file, title=None):
     """
-    保存图像到文件，使用matplotlib而不是cv2.imwrite，提高可靠性
+    保存图像到文件
+    
+    没有标题时直接用write_png按原始分辨率保存；
+    有标题时使用matplotlib保存，再用PIL添加中文标题，提高可靠性
     
     参数:
-        img: 要保存的图像 (numpy数组)
+        img: 要保存的图像 (numpy数组，彩色图像为BGR顺序)
         output_file: 输出文件路径
         title: 可选的图像标题
     
@@ -2160,6 +2366,17 @@ def save_image(img, output_file, title=None):
             # 尝试使用当前工作目录
             output_file = os.path.join(os.getcwd(), os.path.basename(output_file))
             log_print(f"改用当前工作目录: {output_file}")
+        
+        # 没有标题时不需要matplotlib和PIL，直接写出图像
+        if not title:
+            if write_png(img, output_file):
+                log_print(f"图像已成功保存到: {output_file}")
+                return True
+            log_print(f"保存图像失败: {output_file}", 'error')
+            return False
+        
+        import matplotlib.pyplot as plt
+        import matplotlib.font_manager as fm
 
         # 转换OpenCV的BGR图像到RGB (如果需要)
         if len(img.shape) == 3 and img.shape[2] == 3:
@@ -2169,53 +2386,34 @@ def save_image(img, output_file, title=None):
             img_to_save = img
             
         # 保存图像但不包含中文标题 - 更可靠的方式
-        # 第一步：生成图像，但先不设置中文标题
-        plt.figure(figsize=(10, 10))
+        # 第一步：在复用的画布上更新图像数据，但先不设置中文标题
+        fig, ax, im = get_save_canvas()
+        height, width = img_to_save.shape[:2]
         if len(img.shape) == 2 or (len(img.shape) == 3 and img.shape[2] == 1):
-            plt.imshow(img_to_save, cmap='gray')
+            img_to_save = img_to_save.reshape(height, width)
+            im.set_data(img_to_save)
+            im.set_clim(img_to_save.min(), img_to_save.max())
         else:
-            plt.imshow(img_to_save)
-            
-        plt.axis('off')  # 不显示坐标轴
-        plt.tight_layout()  # 调整布局
+            im.set_data(img_to_save)
+        im.set_extent((-0.5, width - 0.5, height - 0.5, -0.5))
+        ax.set_xlim(-0.5, width - 0.5)
+        ax.set_ylim(height - 0.5, -0.5)
         
         # 保存图像
-        plt.savefig(output_file, bbox_inches='tight', pad_inches=0)
-        plt.close()
+        fig.savefig(output_file, bbox_inches='tight', pad_inches=0,
+                    pil_kwargs={'compress_level': PNG_COMPRESSION_LEVEL})
         
         # 如果有中文标题，尝试使用PIL添加标题 - 这通常比matplotlib更可靠
         if title and os.path.exists(output_file):
             try:
-                from PIL import Image, ImageDraw, ImageFont
+                from PIL import Image, ImageDraw
                 
                 # 打开保存的图像
                 pil_img = Image.open(output_file)
                 draw = ImageDraw.Draw(pil_img)
                 
-                # 尝试找到中文字体
-                font_size = 36
-                font = None
-                
-                # 优先尝试Windows系统字体
-                windows_font_paths = [
-                    r"C:\Windows\Fonts\simhei.ttf",  # 黑体
-                    r"C:\Windows\Fonts\msyh.ttc",    # 微软雅黑
-                    r"C:\Windows\Fonts\simsun.ttc",  # 宋体
-                ]
-                
-                for font_path in windows_font_paths:
-                    if os.path.exists(font_path):
-                        try:
-                            font = ImageFont.truetype(font_path, font_size)
-                            # log_print(f"使用PIL字体: {font_path}")
-                            break
-                        except:
-                            continue
-                
-                # 如果没有找到系统字体，使用默认字体
-                if font is None:
-                    font = ImageFont.load_default()
-                    # log_print("使用PIL默认字体")
+                # 中文字体只在第一次使用时查找并加载
+                font = load_title_font(36)
                 
                 # 添加标题到图像顶部
                 text_bbox = draw.textbbox((0, 0), title, font=font)
@@ -2230,7 +2428,7 @@ def save_image(img, output_file, title=None):
                 draw.text((x, y), title, font=font, fill=(0, 0, 0))  # 黑色文本
                 
                 # 保存添加了标题的图像
-                pil_img.save(output_file)
+                pil_img.save(output_file, compress_level=PNG_COMPRESSION_LEVEL)
                 # log_print("使用PIL添加了中文标题")
             except Exception as pil_error:
                 log_print(f"使用PIL添加标题失败: {pil_error}", 'warning')
@@ -2294,7 +2492,7 @@ def save_image(img, output_file, title=None):
         try:
             # 最后尝试直接使用cv2.imwrite
             log_print("最后尝试使用cv2.imwrite")
-            result = cv2.imwrite(output_file, img)
+            result = cv2.imwrite(output_file, img, [cv2.IMWRITE_PNG_COMPRESSION, PNG_COMPRESSION_LEVEL])
             return result
         except:
             return False
@@ -2316,8 +2514,9 @@ def create_overview_image(rooms, extents, output_file, img_size=2000, title="房
     log_print(f"生成房间总览图像: {output_file}")
     
     try:
-        # 创建空白RGB图像
-        img = np.ones((img_size, img_size, 3), dtype=np.uint8) * 255
+        # 复用RGB图像缓冲区，填充为白色背景
+        img = get_buffer('overview', (img_size, img_size, 3))
+        img.fill(255)
         
         # 检查房间数据是否为空
         if not rooms:
@@ -2353,18 +2552,12 @@ def create_overview_image(rooms, extents, output_file, img_size=2000, title="房
         offset_x = (img_size - width * scale) / 2
         offset_y = (img_size - height * scale) / 2
         
-        # 坐标转换函数，将原始坐标转换为图像坐标
-        def transform(point):
-            try:
-                x = int(offset_x + (point[0] - min_x) * scale)
-                y = int(img_size - (offset_y + (point[1] - min_y) * scale))  # Y坐标反转
-                # 确保坐标在图像范围内
-                x = max(0, min(x, img_size - 1))
-                y = max(0, min(y, img_size - 1))
-                return (x, y)
-            except Exception as e:
-                log_print(f"坐标转换出错: {e}, 点: {point}")
-                return (0, 0)  # 返回安全值
+        # 坐标转换函数，将 (N, 2) 原始坐标数组一次性转换为图像坐标
+        def transform_array(arr):
+            x = offset_x + (arr[:, 0] - min_x) * scale
+            y = img_size - (offset_y + (arr[:, 1] - min_y) * scale)  # Y坐标反转
+            # 确保坐标在图像范围内 (先截断再取整，与逐点int()后截断结果相同)
+            return np.stack([np.clip(x, 0, img_size - 1), np.clip(y, 0, img_size - 1)], axis=1).astype(np.int32)
         
         # 使用不同颜色填充房间
         colors = [
@@ -2385,25 +2578,27 @@ def create_overview_image(rooms, extents, output_file, img_size=2000, title="房
         if rooms:
             for i, room in enumerate(rooms):
                 try:
-                    if not room or len(room) < 3:
+                    if room is None or len(room) < 3:
                         continue
                     
                     # 准备房间多边形
-                    points = np.array([transform(point) for point in room], dtype=np.int32)
+                    room_pts = np.asarray(room, dtype=np.float64)
+                    points = transform_array(room_pts)
                     
-                    # 填充房间（半透明颜色）
+                    # 填充房间（半透明颜色），只复制并混合房间包围盒内的区域，结果直接写回原图
                     color = colors[i % len(colors)]
-                    overlay = img.copy()
-                    cv2.fillPoly(overlay, [points], color)
-                    cv2.addWeighted(overlay, 0.3, img, 0.7, 0, img)  # 设置透明度
+                    x0, y0, w, h = cv2.boundingRect(points)
+                    roi = img[y0:y0 + h, x0:x0 + w]
+                    overlay = roi.copy()
+                    cv2.fillPoly(overlay, [points], color, offset=(-x0, -y0))
+                    cv2.addWeighted(overlay, 0.3, roi, 0.7, 0, roi)  # 设置透明度
                     
                     # 绘制房间边界
                     cv2.polylines(img, [points], True, color, 2)
                     
                     # 添加房间编号
-                    centroid_x = sum(point[0] for point in room) / len(room)
-                    centroid_y = sum(point[1] for point in room) / len(room)
-                    center = transform((centroid_x, centroid_y))
+                    center_x, center_y = transform_array(room_pts.mean(axis=0, keepdims=True))[0]
+                    center = (int(center_x), int(center_y))
                     cv2.putText(img, f"{i+1}", center, cv2.FONT_HERSHEY_SIMPLEX, 
                                1.5, (0, 0, 0), 3, cv2.LINE_AA)
                     
@@ -2466,9 +2661,13 @@ def main():
     parser.add_argument('-f', '--file', type=str, help='指定要处理的DWG文件名（位于data_dir中）')
     parser.add_argument('-a', '--area', type=float, default=1.0, help='识别房间的最小面积阈值 (默认: 1.0)')
     parser.add_argument('-s', '--size', type=int, default=2000, help='处理图像的尺寸 (默认: 2000x2000)')
+    parser.add_argument('--preview-size', type=int, default=3000,
+                        help='原始DXF预览图的绘制尺寸，取更小的值可加快绘制 (默认: 3000)')
     parser.add_argument('--convert-only', action='store_true', help='仅转换DWG到DXF，不进行骨架提取')
     parser.add_argument('--oda-path', type=str, help='指定ODA File Converter可执行文件的路径')
     parser.add_argument('--log-dir', type=str, help='指定日志文件保存目录')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1,
+                        help='并行处理文件的进程数 (默认: CPU核心数)')
     
     args = parser.parse_args()
     
@@ -2476,9 +2675,6 @@ def main():
     setup_logging(args.log_dir)
     log_print("=== 房间提取程序开始运行 ===")
     
-    # 设置matplotlib支持中文
-    setup_matplotlib_chinese()
-    
     # 如果指定了ODA路径，设置全局变量
     if args.oda_path:
         global ODA_PATH
@@ -2510,7 +2706,8 @@ def main():
         
         file_output_dir = os.path.join(output_dir, os.path.splitext(os.path.basename(args.file))[0])
         log_print(f"正在处理特定文件: {dwg_path}")
-        rooms, extents = extract_rooms_from_dwg(dwg_path, file_output_dir, args.size, args.area)
+        rooms, extents = extract_rooms_from_dwg(dwg_path, file_output_dir, args.size, args.area,
+                                                preview_size=args.preview_size)
         return
     
     # 处理目录中的所有DWG文件
@@ -2518,17 +2715,57 @@ def main():
         log_print(f"错误: 目录 {data_dir} 不存在", 'error')
         return
     
-    dwg_files = [f for f in os.listdir(data_dir) if f.lower().endswith(('.dwg', '.dxf'))]
+    # scandir的目录项自带文件类型信息，筛选时不需要再逐个stat
+    with os.scandir(data_dir) as entries:
+        dwg_files = [entry.name for entry in entries
+                     if entry.name.lower().endswith(('.dwg', '.dxf')) and entry.is_file()]
     
     if not dwg_files:
         log_print(f"在 {data_dir} 中没有找到DWG或DXF文件", 'warning')
         return
     
-    # 处理每个DWG文件
+    # 同名不同扩展名的文件 (如a.dwg和a.dxf) 会写入同一个输出目录和同一个转换后的DXF，
+    # 并行处理时结果会相互混杂，因此拒绝处理这些文件
+    files_by_stem = defaultdict(list)
     for dwg_file in dwg_files:
-        dwg_path = os.path.join(data_dir, dwg_file)
-        file_output_dir = os.path.join(output_dir, os.path.splitext(dwg_file)[0])
-        rooms, extents = extract_rooms_from_dwg(dwg_path, file_output_dir, args.size, args.area)
+        files_by_stem[os.path.normcase(os.path.splitext(dwg_file)[0])].append(dwg_file)
+    for same_stem_files in files_by_stem.values():
+        if len(same_stem_files) > 1:
+            log_print(f"错误: 文件 {', '.join(sorted(same_stem_files))} 同名，输出会相互覆盖，已跳过", 'error')
+    dwg_files = [dwg_file for dwg_file in dwg_files
+                 if len(files_by_stem[os.path.normcase(os.path.splitext(dwg_file)[0])]) == 1]
+    
+    tasks = [(os.path.join(data_dir, dwg_file), os.path.join(output_dir, os.path.splitext(dwg_file)[0]))
+             for dwg_file in dwg_files]
+    
+    # 各文件互不依赖，使用进程池并行处理 (栅格化和轮廓提取都是CPU密集型，进程可绕开GIL)
+    # 关键词统计模式需要依次累加写入同一个统计文件，仍然逐个处理
+    jobs = max(1, min(args.jobs, len(tasks)))
+    if CAD_PROFILE == '1':
+        jobs = 1
+    
+    if jobs == 1:
+        for dwg_path, file_output_dir in tasks:
+            rooms, extents = extract_rooms_from_dwg(dwg_path, file_output_dir, args.size, args.area,
+                                                    preview_size=args.preview_size)
+    else:
+        log_print(f"使用 {jobs} 个进程并行处理 {len(tasks)} 个文件")
+        # 先写出缓冲中的日志，避免fork出的工作进程继承缓冲后重复写入
+        for handler in logger.handlers:
+            handler.flush()
+        # 每个进程内的线程池只使用分摊到的CPU核心
+        thread_workers = max(1, (os.cpu_count() or 1) // jobs)
+        with concurrent.futures.ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker,
+                                                    initargs=(args.log_dir, ODA_PATH, thread_workers)) as executor:
+            futures = {executor.submit(_process_file_in_worker, dwg_path, file_output_dir, args.size, args.area,
+                                       args.preview_size): dwg_path
+                       for dwg_path, file_output_dir in tasks}
+            for future in concurrent.futures.as_completed(futures):
+                try:
+                    room_count = future.result()
+                    log_print(f"文件处理完成: {futures[future]}，识别出 {room_count} 个房间")
+                except Exception as e:
+                    log_print(f"处理文件 {futures[future]} 时出错: {e}", 'error')
 
     log_print("=== 房间提取程序运行完成 ===")
 
@@ -12,11 +12,21 @@
 """
 import sys
 import os
+import tempfile
 import ezdxf
-from shapely.geometry import LineString, MultiLineString
+import numpy as np
+import shapely
+from shapely.geometry import MultiLineString
 from shapely.ops import unary_union, polygonize
+from shapely.strtree import STRtree
 import argparse
 
+# 图层类别
+OTHER_LAYER, WALL_LAYER, DOOR_LAYER = 0, 1, 2
+
+# 坐标缓存格式版本：修改缓存内容或图层分类、坐标提取逻辑 (classify_layer、entity_to_points 等) 时递增，使旧缓存失效
+CACHE_VERSION = 1
+
 def parse_cad_file(file_path):
     """
     解析 DXF 文件（若是 DWG，请先转换为 DXF）
@@ -30,6 +40,20 @@ def parse_cad_file(file_path):
         sys.exit(1)
 
 
+def classify_layer(name):
+    """
+    按图层名关键词判断图层类别（不区分大小写）
+    墙体关键词: 'wall', '墙'; 门关键词: 'door', '门'
+    返回: WALL_LAYER / DOOR_LAYER / OTHER_LAYER
+    """
+    name = name.lower()
+    if 'wall' in name or '墙' in name:
+        return WALL_LAYER
+    if 'door' in name or '门' in name:
+        return DOOR_LAYER
+    return OTHER_LAYER
+
+
 def query_walls_and_doors(doc):
     """
     遍历 modelspace，按图层名称识别墙体与门实体
@@ -37,67 +61,171 @@ def query_walls_and_doors(doc):
     返回: (walls, doors) 两个实体列表
     """
     msp = doc.modelspace()
+    # 图层名 -> 图层类别，先按图层表填充；实体循环中每个实体只需一次字典查找
+    layer_class = {layer.dxf.name: classify_layer(layer.dxf.name) for layer in doc.layers}
+
     walls, doors = [], []
     for ent in msp:
-        layer = ent.dxf.layer.lower() if hasattr(ent.dxf, 'layer') else ''
-        etype = ent.dxftype()
-        if etype in ('LINE', 'LWPOLYLINE', 'POLYLINE'):
-            if 'wall' in layer or '墙' in layer:
-                walls.append(ent)
-            elif 'door' in layer or '门' in layer:
-                doors.append(ent)
+        if ent.dxftype() not in ('LINE', 'LWPOLYLINE', 'POLYLINE'):
+            continue
+        # 图形实体都有 layer 属性（未设置时为默认图层 '0'），无需 hasattr 检查
+        name = ent.dxf.layer
+        cls = layer_class.get(name)
+        if cls is None:
+            # 图层表中未定义或大小写不一致的图层名，判断一次后加入分类表
+            cls = layer_class[name] = classify_layer(name)
+        if cls == WALL_LAYER:
+            walls.append(ent)
+        elif cls == DOOR_LAYER:
+            doors.append(ent)
     print(f"[INFO] 识别到墙体实体: {len(walls)}，门实体: {len(doors)}")
     return walls, doors
 
 
-def entity_to_lines(ent):
+def entity_to_points(ent):
     """
-    将 DXF 实体转换为 Shapely LineString
+    提取 DXF 实体的二维顶点坐标
     支持 LINE, LWPOLYLINE, POLYLINE
+    返回: [(x, y), ...]，顶点不足两个时返回 None
     """
     et = ent.dxftype()
     if et == 'LINE':
-        a = ent.dxf.start[:2]
-        b = ent.dxf.end[:2]
-        return LineString([a, b])
+        # ezdxf 的 Vec3 不支持切片，需用下标访问
+        start = ent.dxf.start
+        end = ent.dxf.end
+        return [(start[0], start[1]), (end[0], end[1])]
     elif et == 'LWPOLYLINE':
-        pts = [tuple(p[:2]) for p in ent.get_points()]
+        # 通过公开接口只取 x, y 两个分量，不依赖 ezdxf 内部的顶点存储格式
+        pts = ent.get_points('xy')
         if len(pts) >= 2:
-            return LineString(pts)
+            return pts
     elif et == 'POLYLINE':
-        pts = []
-        for v in ent.vertices:
-            if hasattr(v.dxf, 'location'):
-                pts.append(tuple(v.dxf.location[:2]))
+        # VERTEX 实体都有 location 属性，无需 hasattr 检查；先取出全部顶点位置，再一次性取 x, y
+        locations = [v.dxf.location for v in ent.vertices]
+        pts = [(loc.x, loc.y) for loc in locations]
         if len(pts) >= 2:
-            return LineString(pts)
+            return pts
     return None
 
 
-def remove_doors_from_walls(wall_ents, door_ents):
+def entities_to_coords(ents):
+    """
+    收集一批 DXF 实体的顶点坐标，供 shapely.linestrings 一次性构造 LineString
+    返回: (coords, indices)，coords 为 (N, 2) 坐标数组，indices 为每个顶点所属线段的编号
+    """
+    # LINE 通常占绝大多数：一次性读出所有 LINE 的起止点，其余实体再逐个提取顶点
+    is_line = np.array([ent.dxftype() == 'LINE' for ent in ents], dtype=bool)
+    line_ents = [ent for ent, line in zip(ents, is_line) if line]
+    line_coords = np.fromiter((c for ent in line_ents
+                               for c in (ent.dxf.start[0], ent.dxf.start[1], ent.dxf.end[0], ent.dxf.end[1])),
+                              dtype=np.float64, count=4 * len(line_ents)).reshape(-1, 2)
+
+    other_coords, counts = [], np.full(len(ents), 2)
+    for k in np.flatnonzero(~is_line):
+        pts = entity_to_points(ents[k])
+        counts[k] = 0 if pts is None else len(pts)
+        if pts is not None:
+            other_coords.extend(pts)
+
+    # 按实体原顺序拼接坐标，保证生成的线段顺序不变
+    row_is_line = np.repeat(is_line, counts)
+    coords = np.empty((counts.sum(), 2), dtype=np.float64)
+    coords[row_is_line] = line_coords
+    coords[~row_is_line] = np.asarray(other_coords, dtype=np.float64).reshape(-1, 2)
+    counts = counts[counts > 0]
+    indices = np.repeat(np.arange(len(counts)), counts)
+    return coords, indices
+
+
+def load_wall_door_lines(file_path, use_cache=True):
+    """
+    读取 DXF 文件中的墙体与门线段
+    坐标数组缓存到 <file_path>.cad_cache.npz，缓存版本、文件修改时间和大小都不变时直接读取缓存，跳过 ezdxf 解析
+    返回: (wall_lines, door_lines) 两个 LineString 的 numpy 数组
+    """
+    cache_file = file_path + '.cad_cache.npz'
+    stat = os.stat(file_path)
+    key = np.array([CACHE_VERSION, stat.st_mtime_ns, stat.st_size], dtype=np.int64)
+    if use_cache and os.path.isfile(cache_file):
+        try:
+            with np.load(cache_file) as data:
+                if np.array_equal(data['key'], key):
+                    wall_lines = shapely.linestrings(data['wall_coords'], indices=data['wall_indices'])
+                    door_lines = shapely.linestrings(data['door_coords'], indices=data['door_indices'])
+                    print(f"[INFO] 从缓存读取墙体线段: {len(wall_lines)}，门线段: {len(door_lines)}")
+                    return wall_lines, door_lines
+        except Exception as e:
+            print(f"[WARNING] 读取缓存失败，重新解析 CAD 文件: {e}")
+
+    doc = parse_cad_file(file_path)
+    walls, doors = query_walls_and_doors(doc)
+    wall_coords, wall_indices = entities_to_coords(walls)
+    door_coords, door_indices = entities_to_coords(doors)
+    if use_cache:
+        # 先写入同目录下的临时文件再替换，避免并发运行时读到写了一半的缓存
+        tmp_path = None
+        try:
+            with tempfile.NamedTemporaryFile(dir=os.path.dirname(os.path.abspath(cache_file)),
+                                             suffix='.tmp', delete=False) as f:
+                tmp_path = f.name
+                np.savez(f, key=key, wall_coords=wall_coords, wall_indices=wall_indices,
+                         door_coords=door_coords, door_indices=door_indices)
+            os.replace(tmp_path, cache_file)
+        except Exception as e:
+            print(f"[WARNING] 保存缓存失败: {e}")
+            if tmp_path and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    wall_lines = shapely.linestrings(wall_coords, indices=wall_indices)
+    door_lines = shapely.linestrings(door_coords, indices=door_indices)
+    return wall_lines, door_lines
+
+
+def remove_doors_from_walls(wall_lines, door_lines):
     """
     用门几何分割墙体：对每段墙体 LineString 执行差集
     返回: list(LineString)
     """
-    # 转实体
-    wall_lines = [l for l in (entity_to_lines(w) for w in wall_ents) if l]
-    door_lines = [l for l in (entity_to_lines(d) for d in door_ents) if l]
-
-    result = []
-    for w in wall_lines:
-        geom = w
-        for d in door_lines:
-            if geom.intersects(d):
-                geom = geom.difference(d)
-                if geom.is_empty:
-                    break
-        # 收集剩余线段
-        if geom.is_empty:
-            continue
-        if geom.geom_type == 'LineString':
-            result.append(geom)
-        elif geom.geom_type == 'MultiLineString':
-            result.extend(list(geom.geoms))
+    # 包围盒与全部门的总包围盒不相交的墙体不可能与任何门相交，不参与后续查找
+    wb = shapely.bounds(wall_lines)
+    db = shapely.bounds(door_lines)
+    near = np.flatnonzero((wb[:, 0] <= db[:, 2].max(initial=-np.inf)) & (wb[:, 2] >= db[:, 0].min(initial=np.inf)) &
+                          (wb[:, 1] <= db[:, 3].max(initial=-np.inf)) & (wb[:, 3] >= db[:, 1].min(initial=np.inf)))
+
+    # 找出包围盒相交的 (墙体下标, 门下标) 对
+    if len(door_lines) >= 16:
+        # 门较多时用 R 树只取包围盒相交的门
+        wall_idx, door_idx = STRtree(door_lines).query(wall_lines[near])
+    else:
+        # 门很少时建树不划算，用包围盒数组一次算出每段墙体与每个门的包围盒是否相交
+        wb = wb[near]
+        overlap = ((db[:, 0] <= wb[:, None, 2]) & (db[:, 2] >= wb[:, None, 0]) &
+                   (db[:, 1] <= wb[:, None, 3]) & (db[:, 3] >= wb[:, None, 1]))
+        wall_idx, door_idx = np.nonzero(overlap)
+    wall_idx = near[wall_idx]
+
+    # 精确相交判断：门几何预先 prepare 并作为第一个参数，同一个门与多段墙体判断时复用 GEOS 的预处理结构
+    shapely.prepare(door_lines)
+    hit = shapely.intersects(door_lines[door_idx], wall_lines[wall_idx])
+    wall_idx, door_idx = wall_idx[hit], door_idx[hit]
+
+    # 每段墙体减去与它相交的所有门的并集（相同的门组合只合并一次），
+    # 再用一次向量化的 shapely.difference 完成全部差集
+    order = np.lexsort((door_idx, wall_idx))
+    wall_idx, door_idx = wall_idx[order], door_idx[order]
+    hit_walls, starts = np.unique(wall_idx, return_index=True)
+    door_unions = {}
+    cutters = np.empty(len(hit_walls), dtype=object)
+    for k, doors in enumerate(np.split(door_idx, starts[1:]) if len(starts) else []):
+        key = doors.tobytes()
+        if key not in door_unions:
+            door_unions[key] = door_lines[doors[0]] if len(doors) == 1 else shapely.union_all(door_lines[doors])
+        cutters[k] = door_unions[key]
+    clean = np.array(wall_lines, dtype=object)
+    clean[hit_walls] = shapely.difference(wall_lines[hit_walls], cutters)
+
+    # 拆分为单条线段，去掉被门完全覆盖的墙体
+    parts = shapely.get_parts(clean)
+    result = list(parts[~shapely.is_empty(parts)])
     print(f"[INFO] 去除门窗后墙体分段: {len(result)}")
     return result
 
@@ -117,26 +245,26 @@ def main():
     parser = argparse.ArgumentParser(description='CAD前处理：墙体+门->闭合多边形')
     parser.add_argument('input', help='输入DXF文件路径')
     parser.add_argument('--output', '-o', help='可选：保存多边形WKT列表到文本文件')
+    parser.add_argument('--no-cache', action='store_true', help='不读写 <输入文件>.cad_cache.npz 坐标缓存')
     args = parser.parse_args()
 
     if not os.path.isfile(args.input):
         print(f"[ERROR] 找不到文件: {args.input}")
         sys.exit(1)
 
-    doc = parse_cad_file(args.input)
-    walls, doors = query_walls_and_doors(doc)
+    walls, doors = load_wall_door_lines(args.input, use_cache=not args.no_cache)
     clean_walls = remove_doors_from_walls(walls, doors)
     polys, _ = associate_walls(clean_walls)
 
-    # 输出结果
+    # 输出结果：一次向量化调用生成全部 WKT（不截断精度，与 p.wkt 一致），拼接后一次写出
+    wkts = shapely.to_wkt(polys, rounding_precision=-1)
+    text = ''.join(f"Polygon {i}: {w}\n" for i, w in enumerate(wkts, 1))
     if args.output:
         with open(args.output, 'w', encoding='utf-8') as f:
-            for i, p in enumerate(polys, 1):
-                f.write(f"Polygon {i}: {p.wkt}\n")
+            f.write(text)
         print(f"[INFO] 闭合多边形WKT已保存到: {args.output}")
     else:
-        for i, p in enumerate(polys, 1):
-            print(f"Polygon {i}: {p.wkt}")
+        sys.stdout.write(text)
 
 if __name__ == '__main__':
     main()
@@ -12,10 +12,22 @@
 """
 import sys
 import os
+import tempfile
 import ezdxf
-from shapely.geometry import LineString
+import numpy as np
+import shapely
 from shapely.ops import unary_union, polygonize
+from shapely.strtree import STRtree
+import matplotlib
+matplotlib.use('Agg')  # 只保存图片，不需要交互式窗口
 import matplotlib.pyplot as plt
+from matplotlib.collections import LineCollection
+
+# 图层类别
+OTHER_LAYER, WALL_LAYER, DOOR_LAYER = 0, 1, 2
+
+# 坐标缓存格式版本：修改缓存内容或图层分类、坐标提取逻辑 (classify_layer、entity_to_points 等) 时递增，使旧缓存失效
+CACHE_VERSION = 1
 
 # --- 核心函数 ----------------------------------------------------------------
 def parse_cad_file(file_path):
@@ -27,66 +39,181 @@ def parse_cad_file(file_path):
         print(f"[ERROR] 解析 CAD 文件失败: {e}")
         sys.exit(1)
 
+def classify_layer(name):
+    """
+    按图层名关键词判断图层类别（不区分大小写）
+    墙体关键词: 'wall', '墙'; 门关键词: 'door', '门'
+    返回: WALL_LAYER / DOOR_LAYER / OTHER_LAYER
+    """
+    name = name.lower()
+    if 'wall' in name or '墙' in name:
+        return WALL_LAYER
+    if 'door' in name or '门' in name:
+        return DOOR_LAYER
+    return OTHER_LAYER
+
 def query_walls_and_doors(doc):
     msp = doc.modelspace()
+    # 图层名 -> 图层类别，先按图层表填充；实体循环中每个实体只需一次字典查找
+    layer_class = {layer.dxf.name: classify_layer(layer.dxf.name) for layer in doc.layers}
+
     walls, doors = [], []
     for ent in msp:
-        layer = ent.dxf.layer.lower() if hasattr(ent.dxf, 'layer') else ''
-        etype = ent.dxftype()
-        if etype in ('LINE', 'LWPOLYLINE', 'POLYLINE'):
-            if 'wall' in layer or '墙' in layer:
-                walls.append(ent)
-            elif 'door' in layer or '门' in layer:
-                doors.append(ent)
+        if ent.dxftype() not in ('LINE', 'LWPOLYLINE', 'POLYLINE'):
+            continue
+        # 图形实体都有 layer 属性（未设置时为默认图层 '0'），无需 hasattr 检查
+        name = ent.dxf.layer
+        cls = layer_class.get(name)
+        if cls is None:
+            # 图层表中未定义或大小写不一致的图层名，判断一次后加入分类表
+            cls = layer_class[name] = classify_layer(name)
+        if cls == WALL_LAYER:
+            walls.append(ent)
+        elif cls == DOOR_LAYER:
+            doors.append(ent)
     print(f"[INFO] 识别到墙体实体: {len(walls)}，门实体: {len(doors)}")
     return walls, doors
 
-def entity_to_lines(ent):
+def entity_to_points(ent):
     """
-    将 DXF 实体转换为 Shapely LineString
+    提取 DXF 实体的二维顶点坐标
     支持 LINE, LWPOLYLINE, POLYLINE
+    返回: [(x, y), ...]，顶点不足两个时返回 None
     """
     et = ent.dxftype()
     if et == 'LINE':
         # ezdxf 的 Vec3 不支持切片，需用下标访问
         start = ent.dxf.start  # Vec3
         end   = ent.dxf.end    # Vec3
-        a = (start[0], start[1])
-        b = (end[0],   end[1])
-        return LineString([a, b])
+        return [(start[0], start[1]), (end[0], end[1])]
 
     elif et == 'LWPOLYLINE':
-        pts = [tuple(p[:2]) for p in ent.get_points()]
-        return LineString(pts) if len(pts) >= 2 else None
+        # 通过公开接口只取 x, y 两个分量，不依赖 ezdxf 内部的顶点存储格式
+        pts = ent.get_points('xy')
+        return pts if len(pts) >= 2 else None
 
     elif et == 'POLYLINE':
-        pts = []
-        for v in ent.vertices:
-            if hasattr(v.dxf, 'location'):
-                loc = v.dxf.location  # Vec3
-                pts.append((loc[0], loc[1]))
-        return LineString(pts) if len(pts) >= 2 else None
+        # VERTEX 实体都有 location 属性，无需 hasattr 检查；先取出全部顶点位置，再一次性取 x, y
+        locations = [v.dxf.location for v in ent.vertices]
+        pts = [(loc.x, loc.y) for loc in locations]
+        return pts if len(pts) >= 2 else None
 
     return None
 
 
-def remove_doors_from_walls(wall_ents, door_ents):
-    wall_lines = [l for l in (entity_to_lines(w) for w in wall_ents) if l]
-    door_lines = [l for l in (entity_to_lines(d) for d in door_ents) if l]
-    result = []
-    for w in wall_lines:
-        geom = w
-        for d in door_lines:
-            if geom.intersects(d):
-                geom = geom.difference(d)
-                if geom.is_empty:
-                    break
-        if geom.is_empty:
-            continue
-        if geom.geom_type == 'LineString':
-            result.append(geom)
-        else:
-            result.extend(list(geom.geoms))
+def entities_to_coords(ents):
+    """
+    收集一批 DXF 实体的顶点坐标，供 shapely.linestrings 一次性构造 LineString
+    返回: (coords, indices)，coords 为 (N, 2) 坐标数组，indices 为每个顶点所属线段的编号
+    """
+    # LINE 通常占绝大多数：一次性读出所有 LINE 的起止点，其余实体再逐个提取顶点
+    is_line = np.array([ent.dxftype() == 'LINE' for ent in ents], dtype=bool)
+    line_ents = [ent for ent, line in zip(ents, is_line) if line]
+    line_coords = np.fromiter((c for ent in line_ents
+                               for c in (ent.dxf.start[0], ent.dxf.start[1], ent.dxf.end[0], ent.dxf.end[1])),
+                              dtype=np.float64, count=4 * len(line_ents)).reshape(-1, 2)
+
+    other_coords, counts = [], np.full(len(ents), 2)
+    for k in np.flatnonzero(~is_line):
+        pts = entity_to_points(ents[k])
+        counts[k] = 0 if pts is None else len(pts)
+        if pts is not None:
+            other_coords.extend(pts)
+
+    # 按实体原顺序拼接坐标，保证生成的线段顺序不变
+    row_is_line = np.repeat(is_line, counts)
+    coords = np.empty((counts.sum(), 2), dtype=np.float64)
+    coords[row_is_line] = line_coords
+    coords[~row_is_line] = np.asarray(other_coords, dtype=np.float64).reshape(-1, 2)
+    counts = counts[counts > 0]
+    indices = np.repeat(np.arange(len(counts)), counts)
+    return coords, indices
+
+
+def load_wall_door_lines(file_path, use_cache=True):
+    """
+    读取 DXF 文件中的墙体与门线段
+    坐标数组缓存到 <file_path>.cad_cache.npz，缓存版本、文件修改时间和大小都不变时直接读取缓存，跳过 ezdxf 解析
+    返回: (wall_lines, door_lines) 两个 LineString 的 numpy 数组
+    """
+    cache_file = file_path + '.cad_cache.npz'
+    stat = os.stat(file_path)
+    key = np.array([CACHE_VERSION, stat.st_mtime_ns, stat.st_size], dtype=np.int64)
+    if use_cache and os.path.isfile(cache_file):
+        try:
+            with np.load(cache_file) as data:
+                if np.array_equal(data['key'], key):
+                    wall_lines = shapely.linestrings(data['wall_coords'], indices=data['wall_indices'])
+                    door_lines = shapely.linestrings(data['door_coords'], indices=data['door_indices'])
+                    print(f"[INFO] 从缓存读取墙体线段: {len(wall_lines)}，门线段: {len(door_lines)}")
+                    return wall_lines, door_lines
+        except Exception as e:
+            print(f"[WARNING] 读取缓存失败，重新解析 CAD 文件: {e}")
+
+    doc = parse_cad_file(file_path)
+    walls, doors = query_walls_and_doors(doc)
+    wall_coords, wall_indices = entities_to_coords(walls)
+    door_coords, door_indices = entities_to_coords(doors)
+    if use_cache:
+        # 先写入同目录下的临时文件再替换，避免并发运行时读到写了一半的缓存
+        tmp_path = None
+        try:
+            with tempfile.NamedTemporaryFile(dir=os.path.dirname(os.path.abspath(cache_file)),
+                                             suffix='.tmp', delete=False) as f:
+                tmp_path = f.name
+                np.savez(f, key=key, wall_coords=wall_coords, wall_indices=wall_indices,
+                         door_coords=door_coords, door_indices=door_indices)
+            os.replace(tmp_path, cache_file)
+        except Exception as e:
+            print(f"[WARNING] 保存缓存失败: {e}")
+            if tmp_path and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    wall_lines = shapely.linestrings(wall_coords, indices=wall_indices)
+    door_lines = shapely.linestrings(door_coords, indices=door_indices)
+    return wall_lines, door_lines
+
+def remove_doors_from_walls(wall_lines, door_lines):
+    # 包围盒与全部门的总包围盒不相交的墙体不可能与任何门相交，不参与后续查找
+    wb = shapely.bounds(wall_lines)
+    db = shapely.bounds(door_lines)
+    near = np.flatnonzero((wb[:, 0] <= db[:, 2].max(initial=-np.inf)) & (wb[:, 2] >= db[:, 0].min(initial=np.inf)) &
+                          (wb[:, 1] <= db[:, 3].max(initial=-np.inf)) & (wb[:, 3] >= db[:, 1].min(initial=np.inf)))
+
+    # 找出包围盒相交的 (墙体下标, 门下标) 对
+    if len(door_lines) >= 16:
+        # 门较多时用 R 树只取包围盒相交的门
+        wall_idx, door_idx = STRtree(door_lines).query(wall_lines[near])
+    else:
+        # 门很少时建树不划算，用包围盒数组一次算出每段墙体与每个门的包围盒是否相交
+        wb = wb[near]
+        overlap = ((db[:, 0] <= wb[:, None, 2]) & (db[:, 2] >= wb[:, None, 0]) &
+                   (db[:, 1] <= wb[:, None, 3]) & (db[:, 3] >= wb[:, None, 1]))
+        wall_idx, door_idx = np.nonzero(overlap)
+    wall_idx = near[wall_idx]
+
+    # 精确相交判断：门几何预先 prepare 并作为第一个参数，同一个门与多段墙体判断时复用 GEOS 的预处理结构
+    shapely.prepare(door_lines)
+    hit = shapely.intersects(door_lines[door_idx], wall_lines[wall_idx])
+    wall_idx, door_idx = wall_idx[hit], door_idx[hit]
+
+    # 每段墙体减去与它相交的所有门的并集（相同的门组合只合并一次），
+    # 再用一次向量化的 shapely.difference 完成全部差集
+    order = np.lexsort((door_idx, wall_idx))
+    wall_idx, door_idx = wall_idx[order], door_idx[order]
+    hit_walls, starts = np.unique(wall_idx, return_index=True)
+    door_unions = {}
+    cutters = np.empty(len(hit_walls), dtype=object)
+    for k, doors in enumerate(np.split(door_idx, starts[1:]) if len(starts) else []):
+        key = doors.tobytes()
+        if key not in door_unions:
+            door_unions[key] = door_lines[doors[0]] if len(doors) == 1 else shapely.union_all(door_lines[doors])
+        cutters[k] = door_unions[key]
+    clean = np.array(wall_lines, dtype=object)
+    clean[hit_walls] = shapely.difference(wall_lines[hit_walls], cutters)
+
+    # 拆分为单条线段，去掉被门完全覆盖的墙体
+    parts = shapely.get_parts(clean)
+    result = list(parts[~shapely.is_empty(parts)])
     print(f"[INFO] 去除门窗后墙体分段: {len(result)}")
     return result
 
@@ -96,18 +223,32 @@ def associate_walls(wall_lines):
     print(f"[INFO] 生成闭合多边形: {len(polys)} 个")
     return polys, unioned
 
-def visualize(wall_lines, polygons, output_path):
+def lines_to_segments(lines):
+    """
+    把一组 LineString/LinearRing 转换为 LineCollection 需要的坐标数组列表
+    """
+    coords, index = shapely.get_coordinates(lines, return_index=True)
+    return np.split(coords, np.flatnonzero(np.diff(index)) + 1) if len(coords) else []
+
+def visualize(wall_lines, polygons, output_path, dpi=150):
     fig, ax = plt.subplots(figsize=(10, 10))
-    for seg in wall_lines:
-        x, y = seg.xy
-        ax.plot(x, y, linewidth=1)
-    for poly in polygons:
-        x, y = poly.exterior.xy
-        ax.plot(x, y, linewidth=2)
+    # 所有墙体分段和多边形外轮廓各用一个 LineCollection 绘制，不再逐条创建 Line2D；
+    # 颜色按默认颜色循环依次分配，与逐条 ax.plot 的效果一致
+    cycle = plt.rcParams['axes.prop_cycle'].by_key()['color']
+    wall_segments = lines_to_segments(wall_lines)
+    rings = lines_to_segments(shapely.get_exterior_ring(np.asarray(polygons, dtype=object)))
+    wall_colors = [cycle[i % len(cycle)] for i in range(len(wall_segments))]
+    ring_colors = [cycle[(len(wall_segments) + i) % len(cycle)] for i in range(len(rings))]
+    ax.add_collection(LineCollection(wall_segments, colors=wall_colors, linewidths=1,
+                                     capstyle='projecting', joinstyle='round'))
+    ax.add_collection(LineCollection(rings, colors=ring_colors, linewidths=2,
+                                     capstyle='projecting', joinstyle='round'))
+    ax.autoscale_view()
     ax.set_aspect('equal')
     ax.axis('off')
     plt.tight_layout()
-    fig.savefig(output_path, dpi=300)
+    # 诊断用图 150 dpi 已足够清晰；低压缩等级编码快得多，文件只略大
+    fig.savefig(output_path, dpi=dpi, pil_kwargs={'compress_level': 1})
     print(f"[INFO] 可视化图像已保存到: {output_path}")
 
 # --- 主流程 ------------------------------------------------------------------
@@ -117,6 +258,7 @@ if __name__ == '__main__':
     output_dir = r'E:\03-pkusz\03-杂项\09-dwg\output_绿房子'     # 输出目录
     output_wkt = os.path.join(output_dir, 'polygons.txt')        # WKT 列表输出
     output_img = os.path.join(output_dir, 'output.png')          # 可视化图像输出
+    use_cache = True                                             # 是否读写 <输入文件>.cad_cache.npz 坐标缓存
 
     if not os.path.isfile(input_path):
         print(f"[ERROR] 找不到文件: {input_path}")
@@ -128,15 +270,14 @@ if __name__ == '__main__':
         print(f"[INFO] 创建输出目录: {output_dir}")
 
     # 执行前处理
-    doc = parse_cad_file(input_path)
-    walls, doors = query_walls_and_doors(doc)
+    walls, doors = load_wall_door_lines(input_path, use_cache=use_cache)
     clean_walls = remove_doors_from_walls(walls, doors)
     polys, _ = associate_walls(clean_walls)
 
-    # 保存 WKT
+    # 保存 WKT：一次向量化调用生成全部 WKT（不截断精度，与 p.wkt 一致），拼接后一次写出
+    wkts = shapely.to_wkt(polys, rounding_precision=-1)
     with open(output_wkt, 'w', encoding='utf-8') as f:
-        for i, p in enumerate(polys, 1):
-            f.write(f"Polygon {i}: {p.wkt}\n")
+        f.write(''.join(f"Polygon {i}: {w}\n" for i, w in enumerate(wkts, 1)))
     print(f"[INFO] WKT 已保存到: {output_wkt}")
 
     # 可视化并保存图像